@@ -1,6 +1,12 @@
 from django.contrib import admin
+from shop.pagination import EstimatedCountPaginator
 from .models import CartItem
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ('user', 'product', 'custom_design', 'quantity', 'price', 'added_at')
+    # CustomDesign.__str__ shows its owner
+    list_select_related = ('user', 'product', 'custom_design__user')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ('user', 'product', 'custom_design')
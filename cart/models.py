@@ -1,4 +1,8 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
 
 class CartItem(models.Model):
@@ -21,6 +25,33 @@ class CartItem(models.Model):
         return self.price * self.quantity
 
 
+class CartSummary:
+    """Cart totals from one aggregate query; the promo discount is applied in memory"""
+
+    def __init__(self, subtotal, item_count, line_count, promo_code=None):
+        self.subtotal = subtotal
+        self.item_count = item_count
+        self.line_count = line_count
+        self.promo_code = promo_code
+        if promo_code and promo_code.is_valid():
+            self.discount = promo_code.calculate_discount(subtotal)
+        else:
+            self.discount = 0
+        self.total = max(0, subtotal - self.discount)
+
+    @classmethod
+    def for_items(cls, items, promo_code=None):
+        totals = items.aggregate(
+            subtotal=Coalesce(
+                Sum(F('price') * F('quantity')), Value(Decimal('0')),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+            item_count=Coalesce(Sum('quantity'), 0),
+            line_count=Count('id'),
+        )
+        return cls(promo_code=promo_code, **totals)
+
+
 class Cart(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     promo_code = models.ForeignKey('shop.PromoCode', on_delete=models.SET_NULL, null=True, blank=True)
@@ -30,23 +61,40 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart for {self.user.username}"
     
+    @classmethod
+    def for_request(cls, request):
+        """The user's cart (with its promo code), loaded once per request"""
+        cart = getattr(request, '_cart', None)
+        if cart is None:
+            cart, created = cls.objects.select_related('promo_code').get_or_create(user=request.user)
+            request._cart = cart
+        return cart
+    
     def get_items(self):
-        return CartItem.objects.filter(user=self.user)
+        return CartItem.objects.filter(user_id=self.user_id)
+    
+    def get_summary(self):
+        summary = getattr(self, '_summary', None)
+        if summary is None:
+            summary = self._summary = CartSummary.for_items(self.get_items(), self.promo_code)
+        return summary
+    
+    def invalidate_summary(self):
+        self._summary = None
+    
+    def set_promo_code(self, promo_code):
+        self.promo_code = promo_code
+        self.save(update_fields=['promo_code', 'updated_at'])
+        self.invalidate_summary()
     
     def get_subtotal(self):
-        items = self.get_items()
-        return sum(item.total_price() for item in items)
+        return self.get_summary().subtotal
     
     def get_discount(self):
-        if not self.promo_code or not self.promo_code.is_valid():
-            return 0
-        return self.promo_code.calculate_discount(self.get_subtotal())
+        return self.get_summary().discount
     
     def get_total(self):
-        subtotal = self.get_subtotal()
-        discount = self.get_discount()
-        return max(0, subtotal - discount)
+        return self.get_summary().total
     
     def get_item_count(self):
-        items = self.get_items()
-        return sum(item.quantity for item in items)
+        return self.get_summary().item_count
@@ -1,6 +1,7 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from .models import CartItem, Cart
-from shop.models import Product, CustomDesign, PromoCode
+from shop.models import Product, CustomDesign
+from shop.promotions import lookup_promo_code
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
@@ -8,40 +9,35 @@ import json
 
 @login_required
 def cart_view(request):
-    cart_items = CartItem.objects.filter(user=request.user)
-    cart, created = Cart.objects.get_or_create(user=request.user)
+    cart = Cart.for_request(request)
+    cart_items = cart.get_items()
     
     # Handle promo code application
     if request.method == 'POST':
         promo_code = request.POST.get('promo_code')
         if promo_code:
-            try:
-                promo = PromoCode.objects.get(code=promo_code.upper())
-                if promo.is_valid():
-                    cart.promo_code = promo
-                    cart.save()
-                    messages.success(request, f"Promo code '{promo.code}' applied! {promo.description}")
-                else:
-                    messages.error(request, "This promo code is not valid or has expired.")
-            except PromoCode.DoesNotExist:
+            promo = lookup_promo_code(promo_code)
+            if promo is None:
                 messages.error(request, "Invalid promo code.")
+            elif promo.is_valid():
+                cart.set_promo_code(promo)
+                messages.success(request, f"Promo code '{promo.code}' applied! {promo.description}")
+            else:
+                messages.error(request, "This promo code is not valid or has expired.")
         else:
             # Remove promo code
-            cart.promo_code = None
-            cart.save()
+            cart.set_promo_code(None)
             messages.success(request, "Promo code removed.")
     
-    subtotal = cart.get_subtotal()
-    discount = cart.get_discount()
-    total = cart.get_total()
+    summary = cart.get_summary()
     
     context = {
         'cart_items': cart_items,
-        'subtotal': subtotal,
-        'discount': discount,
-        'total': total,
+        'subtotal': summary.subtotal,
+        'discount': summary.discount,
+        'total': summary.total,
         'promo_code': cart.promo_code,
-        'item_count': cart.get_item_count(),
+        'item_count': summary.item_count,
     }
     return render(request, 'cart/cart.html', context)
 
@@ -101,49 +97,40 @@ def apply_promo_code(request):
         if not promo_code:
             return JsonResponse({'success': False, 'error': 'Please enter a promo code.'})
         
-        try:
-            promo = PromoCode.objects.get(code=promo_code.upper())
-            if promo.is_valid():
-                cart, created = Cart.objects.get_or_create(user=request.user)
-                cart.promo_code = promo
-                cart.save()
-                
-                subtotal = cart.get_subtotal()
-                discount = cart.get_discount()
-                total = cart.get_total()
-                
-                return JsonResponse({
-                    'success': True,
-                    'message': f"Promo code applied! {promo.description}",
-                    'subtotal': float(subtotal),
-                    'discount': float(discount),
-                    'total': float(total),
-                    'promo_code': promo.code
-                })
-            else:
-                return JsonResponse({'success': False, 'error': 'This promo code is not valid or has expired.'})
-        except PromoCode.DoesNotExist:
+        promo = lookup_promo_code(promo_code)
+        if promo is None:
             return JsonResponse({'success': False, 'error': 'Invalid promo code.'})
+        if promo.is_valid():
+            cart = Cart.for_request(request)
+            cart.set_promo_code(promo)
+            summary = cart.get_summary()
+            
+            return JsonResponse({
+                'success': True,
+                'message': f"Promo code applied! {promo.description}",
+                'subtotal': float(summary.subtotal),
+                'discount': float(summary.discount),
+                'total': float(summary.total),
+                'promo_code': promo.code
+            })
+        else:
+            return JsonResponse({'success': False, 'error': 'This promo code is not valid or has expired.'})
     
     return JsonResponse({'success': False, 'error': 'Invalid request.'})
 
 @login_required
 def remove_promo_code(request):
     if request.method == 'POST':
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        cart.promo_code = None
-        cart.save()
-        
-        subtotal = cart.get_subtotal()
-        discount = cart.get_discount()
-        total = cart.get_total()
+        cart = Cart.for_request(request)
+        cart.set_promo_code(None)
+        summary = cart.get_summary()
         
         return JsonResponse({
             'success': True,
             'message': 'Promo code removed.',
-            'subtotal': float(subtotal),
-            'discount': float(discount),
-            'total': float(total)
+            'subtotal': float(summary.subtotal),
+            'discount': float(summary.discount),
+            'total': float(summary.total)
         })
     
     return JsonResponse({'success': False, 'error': 'Invalid request.'})
@@ -1,8 +1,25 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import Category, Product, CustomDesign, Review, Order, OrderItem, PromoCode
+from django.utils import timezone
+from .models import Category, Product, CustomDesign, Review, Order, OrderItem, PromoCode, Task
+from .exports import order_export_response
+from .pagination import EstimatedCountPaginator
+from .taskqueue import requeue as requeue_tasks
+
+
+def status_actions(model):
+    """One admin action per status, each a single UPDATE however many rows are selected"""
+    actions = []
+    for status, label in model.STATUS_CHOICES:
+        def action(modeladmin, request, queryset, status=status, label=label):
+            updated = queryset.exclude(status=status).update(status=status, updated_at=timezone.now())
+            modeladmin.message_user(request, f"{updated} marked as {label.lower()}.")
+        action.__name__ = f'mark_{status}'
+        action.short_description = f'Mark selected as {label.lower()}'
+        actions.append(action)
+    return actions
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -14,28 +31,32 @@ class CategoryAdmin(admin.ModelAdmin):
     ordering = ['name']
 
     def product_count(self, obj):
-        return obj.product_set.count()
+        return obj.product_count
     product_count.short_description = 'Products'
+    product_count.admin_order_field = 'product_count'
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'size', 'framed', 'price_display', 'in_stock', 'featured', 'is_active', 'views_count']
+    list_select_related = ['category']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_filter = ['category', 'size', 'framed', 'in_stock', 'featured', 'is_active', 'created_at']
-    search_fields = ['name', 'description', 'category__name']
+    search_fields = ['name', 'sku', 'description', 'category__name']
     prepopulated_fields = {'slug': ('name',)}
     list_editable = ['in_stock', 'featured', 'is_active']
     ordering = ['-created_at']
-    readonly_fields = ['views_count', 'sales_count', 'rating']
+    readonly_fields = ['views_count', 'sales_count', 'rating', 'rating_count']
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('name', 'slug', 'description', 'category', 'image')
+            'fields': ('name', 'slug', 'sku', 'description', 'category', 'image')
         }),
         ('Pricing & Options', {
             'fields': ('base_price', 'size', 'framed')
         }),
         ('Status & Statistics', {
-            'fields': ('in_stock', 'featured', 'is_active', 'views_count', 'sales_count', 'rating')
+            'fields': ('in_stock', 'featured', 'is_active', 'views_count', 'sales_count', 'rating', 'rating_count')
         }),
     )
 
@@ -46,11 +67,16 @@ class ProductAdmin(admin.ModelAdmin):
 @admin.register(CustomDesign)
 class CustomDesignAdmin(admin.ModelAdmin):
     list_display = ['user', 'size', 'framed', 'price_display', 'status', 'phone_number', 'created_at']
+    list_select_related = ['user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ['user']
     list_filter = ['size', 'framed', 'status', 'created_at']
     search_fields = ['user__username', 'user__email', 'phone_number', 'notes']
     readonly_fields = ['created_at', 'updated_at']
     list_editable = ['status']
     ordering = ['-created_at']
+    actions = status_actions(CustomDesign)
     
     fieldsets = (
         ('User Information', {
@@ -71,6 +97,10 @@ class CustomDesignAdmin(admin.ModelAdmin):
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ['user', 'product', 'rating', 'is_approved', 'created_at']
+    list_select_related = ['user', 'product']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ['user', 'product']
     list_filter = ['rating', 'is_approved', 'created_at']
     search_fields = ['user__username', 'product__name', 'comment']
     readonly_fields = ['created_at']
@@ -90,16 +120,22 @@ class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
     readonly_fields = ['product_name', 'price']
+    raw_id_fields = ['product', 'custom_design']
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['order_number', 'user', 'total_amount_display', 'status', 'created_at']
+    list_select_related = ['user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ['user']
     list_filter = ['status', 'created_at']
     search_fields = ['order_number', 'user__username', 'user__email', 'phone_number']
     readonly_fields = ['order_number', 'total_amount', 'created_at', 'updated_at']
     list_editable = ['status']
     ordering = ['-created_at']
     inlines = [OrderItemInline]
+    actions = status_actions(Order) + ['export_csv', 'export_jsonl']
     
     fieldsets = (
         ('Order Information', {
@@ -117,6 +153,14 @@ class OrderAdmin(admin.ModelAdmin):
         return f"{obj.total_amount} LE"
     total_amount_display.short_description = 'Total Amount'
 
+    def export_csv(self, request, queryset):
+        return order_export_response(queryset, 'csv')
+    export_csv.short_description = 'Export selected orders as CSV'
+
+    def export_jsonl(self, request, queryset):
+        return order_export_response(queryset, 'jsonl')
+    export_jsonl.short_description = 'Export selected orders as JSON lines'
+
 @admin.register(PromoCode)
 class PromoCodeAdmin(admin.ModelAdmin):
     list_display = ['code', 'description', 'discount_type', 'discount_value_display', 'min_order_amount', 'is_active', 'valid_until', 'usage_count']
@@ -161,3 +205,25 @@ class PromoCodeAdmin(admin.ModelAdmin):
 admin.site.site_header = "RHINO.EG Administration"
 admin.site.site_title = "RHINO.EG Admin"
 admin.site.index_title = "Welcome to RHINO.EG Administration"
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'run_at', 'started_at', 'finished_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_filter = ['status', 'name']
+    readonly_fields = ['created_at', 'started_at', 'finished_at', 'locked_by', 'last_error']
+    ordering = ['-created_at']
+    actions = ['requeue']
+
+    def requeue(self, request, queryset):
+        selected = queryset.exclude(status=Task.RUNNING)
+        total = selected.count()
+        updated = requeue_tasks(selected, run_at=timezone.now(), attempts=0, locked_by='')
+        self.message_user(request, f"{updated} tasks queued again.")
+        if updated < total:
+            self.message_user(
+                request, f"{total - updated} tasks skipped: an identical task is already queued.", messages.WARNING,
+            )
+    requeue.short_description = 'Run selected tasks again'
+
@@ -0,0 +1,258 @@
+"""Drive every shop and cart route through the test client, recording latency and SQL queries.
+
+The whole run happens inside one transaction that is rolled back at the
+end, and every request that writes gets its own savepoint, so the database
+is unchanged afterwards and each iteration sees the same data. Commits are
+therefore not part of the timings. Files go to a temporary MEDIA_ROOT and
+buffered product view hits are discarded, so neither outlives the run.
+"""
+import io
+import json
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+from collections import Counter, namedtuple
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from cart.models import CartItem
+from .caching import bump_version
+from .counters import product_views
+from .models import Category, Order, Product, PromoCode, Review
+from .uploads import start_upload, write_chunk
+
+PERCENTILES = (50, 90, 95, 99)
+STAFF_USERNAME = 'benchmark-staff'
+
+# `path` and `data` may be callables taking the fixtures; they run untimed, inside the
+# iteration's savepoint, so they can create whatever the request consumes
+Scenario = namedtuple('Scenario', 'name method path user data content_type writes',
+                      defaults=(None, None, False))
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Fixtures:
+    """The rows the scenarios point at, picked from whatever data the database holds"""
+
+    def __init__(self):
+        cart_owners = CartItem.objects.filter(product__isnull=False).values('user')
+        order = Order.objects.filter(user__in=cart_owners).order_by('user', '-created_at').first()
+        product = Product.objects.filter(is_active=True).exists()
+        if order is None or not product:
+            raise BenchmarkError("Need products and a user with orders and a cart; run seed_data first")
+        self.shopper = order.user
+        self.order = order
+        self.cart_item = CartItem.objects.filter(user=self.shopper, product__isnull=False).first()
+        self.product = Product.objects.filter(is_active=True).order_by('-sales_count', 'pk').first()
+        self.unreviewed = (
+            Product.objects.filter(is_active=True)
+            .exclude(pk__in=Review.objects.filter(user=self.shopper).values('product'))
+            .order_by('pk').first()
+        )
+        self.category = Category.objects.filter(is_active=True, product_count__gt=0).order_by('-product_count').first()
+        self.promo_code = PromoCode.objects.filter(is_active=True, valid_until__gt=timezone.now()).first()
+        self.search_term = self.product.name.split()[0]
+        self.staff, _ = User.objects.get_or_create(username=STAFF_USERNAME, defaults={'is_staff': True})
+        self.upload = start_upload(self.shopper, 'benchmark.png', len(design_png()))
+
+    def new_upload(self, complete=False):
+        data = design_png()
+        upload = start_upload(self.shopper, 'benchmark.png', len(data))
+        if complete:
+            write_chunk(upload, 0, io.BytesIO(data), len(data))
+        return upload
+
+
+_design_png = None
+
+
+def design_png():
+    """A small image that still passes the print size check"""
+    global _design_png
+    if _design_png is None:
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 600), 'orange').save(buffer, 'PNG')
+        _design_png = buffer.getvalue()
+    return _design_png
+
+
+def scenarios(f):
+    shop = [
+        Scenario('shop_home', 'get', reverse('shop_home'), 'anonymous'),
+        Scenario('product_list', 'get', reverse('product_list'), 'anonymous'),
+        Scenario('product_list page 5 by price', 'get', reverse('product_list') + '?sort=price&page=5', 'anonymous'),
+        Scenario('product_list category', 'get',
+                 f"{reverse('product_list')}?category={f.category.slug if f.category else ''}", 'anonymous'),
+        Scenario('product_list search', 'get', f"{reverse('product_list')}?search={f.search_term}", 'anonymous'),
+        Scenario('product_list filtered', 'get', reverse('product_list') + '?size=A4&framed=1&rating=4', 'anonymous'),
+        Scenario('product_detail', 'get', reverse('product_detail', args=[f.product.slug]), 'anonymous'),
+        Scenario('product_detail signed in', 'get', reverse('product_detail', args=[f.product.slug]), 'shopper'),
+        Scenario('shop_contact', 'get', reverse('shop_contact'), 'anonymous'),
+        Scenario('shop_contact submit', 'post', reverse('shop_contact'), 'anonymous', {
+            'name': 'Benchmark', 'email': 'bench@example.com', 'subject': 'Hello', 'message': 'Just measuring.',
+        }),
+        Scenario('shop_search', 'get', f"{reverse('shop_search')}?q={f.search_term}", 'anonymous'),
+        Scenario('signup', 'get', reverse('signup'), 'anonymous'),
+        Scenario('upload_custom_design', 'get', reverse('upload_custom_design'), 'shopper'),
+        Scenario('design_upload_start', 'post', reverse('design_upload_start'), 'shopper',
+                 json.dumps({'filename': 'art.png', 'size': 1024}), 'application/json', writes=True),
+        Scenario('design_upload_chunk status', 'get', reverse('design_upload_chunk', args=[f.upload.pk]), 'shopper'),
+        Scenario('design_upload_chunk put', 'put',
+                 lambda f: reverse('design_upload_chunk', args=[f.new_upload().pk]), 'shopper',
+                 design_png(), 'application/octet-stream', writes=True),
+        Scenario('design_upload_complete', 'post',
+                 lambda f: reverse('design_upload_complete', args=[f.new_upload(complete=True).pk]), 'shopper',
+                 {'size': 'A4', 'framed': 'on', 'phone_number': '01000000000', 'notes': ''}, writes=True),
+        Scenario('custom_design_success', 'get', reverse('custom_design_success'), 'shopper'),
+        Scenario('checkout', 'get', reverse('checkout'), 'shopper'),
+        Scenario('checkout submit', 'post', reverse('checkout'), 'shopper', lambda f: {
+            'shipping_address': '1 Benchmark St, Cairo', 'phone_number': '01000000000',
+            'checkout_token': uuid.uuid4().hex,
+        }, writes=True),
+        Scenario('order_detail', 'get', reverse('order_detail', args=[f.order.pk]), 'shopper'),
+        Scenario('my_orders', 'get', reverse('my_orders'), 'shopper'),
+        Scenario('add_review', 'post', reverse('add_review', args=[(f.unreviewed or f.product).pk]), 'shopper',
+                 {'rating': '5', 'comment': 'Lovely print.'}, writes=True),
+        Scenario('task_stats', 'get', reverse('task_stats'), 'staff'),
+    ]
+    promo = json.dumps({'promo_code': f.promo_code.code if f.promo_code else 'NONE'})
+    cart = [
+        Scenario('cart_view', 'get', reverse('cart_view'), 'shopper'),
+        Scenario('add_to_cart', 'post', reverse('add_to_cart', args=[f.product.pk]), 'shopper',
+                 {'quantity': '1'}, writes=True),
+        Scenario('update_cart_quantity', 'post', reverse('update_cart_quantity', args=[f.cart_item.pk]), 'shopper',
+                 {'quantity': '2'}, writes=True),
+        Scenario('remove_from_cart', 'post', reverse('remove_from_cart', args=[f.cart_item.pk]), 'shopper',
+                 writes=True),
+        Scenario('apply_promo_code', 'post', reverse('apply_promo_code'), 'shopper', promo, 'application/json',
+                 writes=True),
+        Scenario('remove_promo_code', 'post', reverse('remove_promo_code'), 'shopper', writes=True),
+    ]
+    return shop + cart
+
+
+def percentile(values, p):
+    """Linear interpolation between closest ranks; `values` must be sorted"""
+    if len(values) == 1:
+        return values[0]
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(timings, queries, statuses, sizes, cache):
+    timings = sorted(timings)
+    result = {
+        'requests': len(timings),
+        'latency_ms': {
+            'min': round(timings[0], 3),
+            'mean': round(statistics.fmean(timings), 3),
+            'max': round(timings[-1], 3),
+            **{f'p{p}': round(percentile(timings, p), 3) for p in PERCENTILES},
+        },
+        'queries': {'min': min(queries), 'median': statistics.median(queries), 'max': max(queries)},
+        'status': {str(code): count for code, count in sorted(statuses.items())},
+        'response_bytes': round(statistics.fmean(sizes)),
+    }
+    if cache:
+        result['page_cache'] = dict(sorted(cache.items()))
+    return result
+
+
+def run_scenario(scenario, fixtures, clients, iterations, warmup, cold_cache=False):
+    client = clients[scenario.user]
+    timings, queries, sizes = [], [], []
+    statuses, cache = Counter(), Counter()
+    for iteration in range(warmup + iterations):
+        if cold_cache:
+            bump_version('catalog')
+        with transaction.atomic():
+            path = scenario.path(fixtures) if callable(scenario.path) else scenario.path
+            data = scenario.data(fixtures) if callable(scenario.data) else scenario.data
+            kwargs = {'content_type': scenario.content_type} if scenario.content_type else {}
+            if scenario.method == 'put':
+                kwargs['headers'] = {'Upload-Offset': '0'}
+            request = getattr(client, scenario.method)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = request(path, data, **kwargs) if data is not None else request(path, **kwargs)
+                elapsed = (time.perf_counter() - started) * 1000
+            if scenario.writes:
+                transaction.set_rollback(True)
+        # Flashed messages would otherwise show up on the next page
+        client.cookies.pop('messages', None)
+        # Buffered hits are flushed outside the transaction, so they would survive the rollback
+        product_views.discard()
+        if iteration < warmup:
+            continue
+        timings.append(elapsed)
+        queries.append(len(captured))
+        statuses[response.status_code] += 1
+        sizes.append(0 if response.streaming else len(response.content))
+        if response.has_header('X-Cache'):
+            cache[response['X-Cache']] += 1
+    return summarize(timings, queries, statuses, sizes, cache)
+
+
+def data_volumes():
+    return {
+        'products': Product.objects.count(),
+        'categories': Category.objects.count(),
+        'users': User.objects.count(),
+        'reviews': Review.objects.count(),
+        'orders': Order.objects.count(),
+        'cart_items': CartItem.objects.count(),
+    }
+
+
+def run_benchmark(iterations=20, warmup=2, only=None, cold_cache=False, progress=None):
+    """Run every scenario (or those whose name contains `only`) and return the report as a dict"""
+    started = timezone.now()
+    scratch = tempfile.mkdtemp(prefix='benchmark-')
+    media = override_settings(MEDIA_ROOT=f'{scratch}/media', DESIGN_UPLOAD_DIR=f'{scratch}/partial')
+    results = {}
+    try:
+        with media, transaction.atomic():
+            fixtures = Fixtures()
+            # Server errors are recorded as 500s instead of ending the run
+            clients = {user: Client(raise_request_exception=False) for user in ('anonymous', 'shopper', 'staff')}
+            clients['shopper'].force_login(fixtures.shopper)
+            clients['staff'].force_login(fixtures.staff)
+            volumes = data_volumes()
+            for scenario in scenarios(fixtures):
+                if only and only not in scenario.name:
+                    continue
+                results[scenario.name] = run_scenario(scenario, fixtures, clients, iterations, warmup, cold_cache)
+                if progress:
+                    progress(scenario.name, results[scenario.name])
+            transaction.set_rollback(True)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return {
+        'meta': {
+            'started_at': started.isoformat(),
+            'seconds': round((timezone.now() - started).total_seconds(), 3),
+            'iterations': iterations,
+            'warmup': warmup,
+            'cold_cache': cold_cache,
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'data': volumes,
+        },
+        'results': results,
+    }
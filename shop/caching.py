@@ -0,0 +1,163 @@
+import hashlib
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Category
+
+
+def _version_key(name):
+    return f'rhino:version:{name}'
+
+
+def _initial_version():
+    # Random rather than 1, so a stamp lost to eviction or a cache flush never comes back
+    # with a value that a process has already memoized data under
+    return random.getrandbits(48)
+
+
+# Seconds a process trusts the stamp it last read before asking the shared cache again.
+# A bump made in this process is seen at once, one made elsewhere within this delay
+VERSION_CHECK_INTERVAL = getattr(settings, 'CACHE_VERSION_CHECK_INTERVAL', 5)
+
+# name -> (version, monotonic time it was read) for this process
+_local_versions = {}
+
+
+def get_version(name):
+    """Current version stamp of a cached data set, e.g. 'catalog'"""
+    now = time.monotonic()
+    local = _local_versions.get(name)
+    if local is not None and now - local[1] < VERSION_CHECK_INTERVAL:
+        return local[0]
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        initial = _initial_version()
+        cache.add(key, initial, None)
+        version = cache.get(key, initial)
+    _local_versions[name] = (version, now)
+    return version
+
+
+def bump_version(name):
+    """Invalidate everything cached under the given version stamp once the current transaction commits.
+
+    Bumped any earlier, a request could rebuild the cache from the rows as
+    they were before the commit and keep them under the new stamp.
+    """
+    transaction.on_commit(lambda: _bump_version(name))
+
+
+def _bump_version(name):
+    key = _version_key(name)
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), None)
+        version = cache.incr(key)
+    _local_versions[name] = (version, time.monotonic())
+    return version
+
+
+def versioned_key(name, *parts):
+    """Cache key that changes whenever the named version is bumped"""
+    digest = hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+    return f'rhino:{name}:{get_version(name)}:{digest}'
+
+
+# Seconds a cached page is served as fresh; after that one worker rebuilds it while the rest serve the stale copy
+PAGE_CACHE_TTL = getattr(settings, 'PAGE_CACHE_TTL', 60)
+# Stale copies are dropped for good after this
+PAGE_CACHE_MAX_AGE = getattr(settings, 'PAGE_CACHE_MAX_AGE', 600)
+PAGE_LOCK_TIMEOUT = 30
+# How long a request waits on another worker's rebuild of a missing page before rendering it itself
+PAGE_LOCK_WAIT = 2.0
+PAGE_LOCK_POLL = 0.05
+
+
+def _cacheable(request, response):
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    # The page holds a CSRF token or flashed messages meant for this visitor only
+    if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        return False
+    storage = getattr(request, '_messages', None)
+    return not (storage is not None and storage.used)
+
+
+def _cached_response(entry, status):
+    response = entry[1]
+    response['X-Cache'] = status
+    return response
+
+
+def cache_anonymous_page(params=()):
+    """Cache a view's response for anonymous GETs under the 'catalog' version stamp.
+
+    The key is the path plus the listed query parameters; other parameters do
+    not change the page and are ignored. Only one worker rebuilds an expired
+    page, everyone else gets the stale copy or waits briefly for the new one.
+    The rebuild lock is a cache.add on the default cache, so it only holds
+    across processes because that cache is shared (see CACHES in settings).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD') or request.user.is_authenticated
+                    or 'messages' in request.COOKIES):
+                return view(request, *args, **kwargs)
+
+            query = sorted((name, value) for name in params for value in request.GET.getlist(name) if value)
+            key = versioned_key('catalog', 'page', request.path, query)
+            lock_key = f'{key}:lock'
+            entry = cache.get(key)
+            if entry is not None and entry[0] > time.time():
+                return _cached_response(entry, 'HIT')
+
+            locked = cache.add(lock_key, 1, PAGE_LOCK_TIMEOUT)
+            if not locked:
+                if entry is not None:
+                    return _cached_response(entry, 'STALE')
+                deadline = time.monotonic() + PAGE_LOCK_WAIT
+                while time.monotonic() < deadline:
+                    time.sleep(PAGE_LOCK_POLL)
+                    entry = cache.get(key)
+                    if entry is not None:
+                        return _cached_response(entry, 'HIT')
+            try:
+                response = view(request, *args, **kwargs)
+                if locked and _cacheable(request, response):
+                    cache.set(key, (time.time() + PAGE_CACHE_TTL, response), PAGE_CACHE_MAX_AGE)
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapped
+    return decorator
+
+
+# (version, categories) for this process; swapped as a whole so readers never see a torn pair.
+# The stamp lives in the shared cache, so a bump in any worker reloads every process's copy
+# once the local stamp is rechecked; until then a warm menu costs no query at all
+_active_categories = (None, [])
+
+
+def get_active_categories(request=None):
+    """Active categories, cached per process and reused for the rest of the request"""
+    global _active_categories
+    if request is not None and hasattr(request, '_active_categories'):
+        return request._active_categories
+    version = get_version('categories')
+    cached_version, categories = _active_categories
+    if cached_version != version:
+        categories = list(Category.objects.filter(is_active=True))
+        _active_categories = (version, categories)
+    if request is not None:
+        request._active_categories = categories
+    return categories
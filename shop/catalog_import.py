@@ -0,0 +1,223 @@
+"""Bulk catalog import from CSV or JSON.
+
+Rows are matched to products by SKU, so importing the same file again only
+writes what changed. Products are written with bulk_create/bulk_update,
+which bypass Product.save() and the signals, so the listing rows, search
+index, category counters and final prices are maintained here instead.
+"""
+import csv
+import json
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from . import search
+from .caching import bump_version
+from .counters import recount_categories
+from .images import generate_derivatives
+from .listings import LISTING_COUNTER_FIELDS, build_listing
+from .models import Category, Product, ProductListing
+from .slugs import next_free_slug, slug_base
+from .storage import file_sha256
+
+BATCH_SIZE = 500
+IMAGE_DIR = 'products/imported'
+# Copied from the row as is; sku, category and image are resolved separately
+PRODUCT_FIELDS = ('name', 'description', 'base_price', 'size', 'framed', 'in_stock', 'featured', 'is_active')
+UPDATE_FIELDS = PRODUCT_FIELDS + ('category', 'image', 'image_hash', 'image_width', 'final_price')
+LISTING_UPDATE_FIELDS = [
+    field.name for field in ProductListing._meta.concrete_fields
+    if not field.primary_key and field.name not in LISTING_COUNTER_FIELDS
+]
+# What a missing, unreadable, truncated or oversized image raises; such a row is imported without it
+IMAGE_ERRORS = (OSError, ValueError, EOFError, SyntaxError, Image.DecompressionBombError)
+BOOLEANS = {'1': True, 'true': True, 'yes': True, 'y': True, '0': False, 'false': False, 'no': False, 'n': False}
+
+
+def read_rows(path):
+    """Rows of a CSV file, or of a JSON list (optionally under a "products" key)"""
+    if path.lower().endswith('.json'):
+        with open(path, encoding='utf-8') as fh:
+            data = json.load(fh)
+        yield from data['products'] if isinstance(data, dict) else data
+        return
+    with open(path, newline='', encoding='utf-8-sig') as fh:
+        yield from csv.DictReader(fh)
+
+
+def _text(row, name, default=''):
+    value = row.get(name)
+    return default if value is None else str(value).strip()
+
+
+def _boolean(row, name, default):
+    value = row.get(name)
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    try:
+        return BOOLEANS[str(value).strip().lower()]
+    except KeyError:
+        raise ValueError(f'{name} must be yes or no, not {value!r}')
+
+
+def clean_row(row):
+    """Validate one input row; returns (sku, product values, category name, image path)"""
+    sku = _text(row, 'sku')
+    name = _text(row, 'name')
+    if not sku or not name:
+        raise ValueError('sku and name are required')
+    try:
+        base_price = Decimal(_text(row, 'base_price') or _text(row, 'price'))
+    except InvalidOperation:
+        raise ValueError('base_price must be a number')
+    size = _text(row, 'size', 'A4').upper() or 'A4'
+    if size not in dict(Product.SIZE_CHOICES):
+        raise ValueError(f'unknown size {size!r}')
+    values = {
+        'name': name[:Product._meta.get_field('name').max_length],
+        'description': _text(row, 'description'),
+        'base_price': base_price,
+        'size': size,
+        'framed': _boolean(row, 'framed', False),
+        'in_stock': _boolean(row, 'in_stock', True),
+        'featured': _boolean(row, 'featured', False),
+        'is_active': _boolean(row, 'is_active', True),
+    }
+    return sku, values, _text(row, 'category'), _text(row, 'image')
+
+
+def store_image(source, current=None):
+    """Copy an image into storage under its content hash and build its derivatives.
+
+    Returns (stored name, image hash, image width); `current` is the product's
+    existing triple, reused without touching storage when the file has not changed.
+    """
+    digest = file_sha256(source)
+    name = f'{IMAGE_DIR}/{digest[:2]}/{digest}{os.path.splitext(source)[1].lower()}'
+    if current and current[0] == name and current[1] and current[2]:
+        return current
+    if not default_storage.exists(name):
+        with open(source, 'rb') as fh:
+            name = default_storage.save(name, File(fh))
+    return (name, *generate_derivatives(Product(image=name).image))
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+class CatalogImporter:
+    def __init__(self, image_root='', batch_size=BATCH_SIZE, workers=4):
+        self.image_root = image_root
+        self.batch_size = batch_size
+        self.workers = workers
+        self.stats = Counter()
+        self.errors = []
+        self.categories = {category.name.lower(): category for category in Category.objects.all()}
+        # Every slug in use, so new products get unique slugs without a query each
+        self.taken_slugs = set(Product.objects.values_list('slug', flat=True))
+        self.slug_length = Product._meta.get_field('slug').max_length
+
+    def run(self, rows):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for batch in _batches(enumerate(rows, start=1), self.batch_size):
+                self.import_batch(batch, pool)
+        if self.stats['created'] or self.stats['updated']:
+            recount_categories()
+            bump_version('catalog')
+            bump_version('categories')
+        return self.stats
+
+    def category(self, name):
+        if not name:
+            return None
+        category = self.categories.get(name.lower())
+        if category is None:
+            category = Category.objects.create(name=name)
+            self.categories[name.lower()] = category
+            self.stats['categories'] += 1
+        return category
+
+    def import_batch(self, batch, pool):
+        rows = {}
+        for number, row in batch:
+            try:
+                sku, values, category, image = clean_row(row)
+            except ValueError as exc:
+                self.errors.append(f'row {number}: {exc}')
+                self.stats['skipped'] += 1
+                continue
+            # A SKU repeated within the batch: the last row wins
+            rows[sku] = (number, values, category, image)
+
+        existing = Product.objects.select_related('category').in_bulk(list(rows), field_name='sku')
+        images = {}
+        for sku, (number, _, _, image) in rows.items():
+            if image:
+                product = existing.get(sku)
+                current = (product.image.name, product.image_hash, product.image_width) if product and product.image else None
+                source = os.path.join(self.image_root, image)
+                images[sku] = (number, pool.submit(store_image, source, current))
+
+        created, updated = [], []
+        for sku, (number, values, category_name, _) in rows.items():
+            product = existing.get(sku) or Product(sku=sku)
+            values['category'] = self.category(category_name)
+            if sku in images:
+                number, future = images.pop(sku)
+                try:
+                    values['image'], values['image_hash'], values['image_width'] = future.result()
+                except IMAGE_ERRORS as exc:
+                    self.errors.append(f'row {number}: image {exc}')
+                    self.stats['image_errors'] += 1
+
+            changed = product.pk is None
+            for field, value in values.items():
+                current = product.image.name if field == 'image' else getattr(product, field)
+                if current != value:
+                    setattr(product, field, value)
+                    changed = True
+            product.final_price = product.get_final_price()
+
+            if product.pk is None:
+                base = slug_base(product.name, self.slug_length, 'product')
+                product.slug = next_free_slug(base, self.taken_slugs, self.slug_length)
+                self.taken_slugs.add(product.slug)
+                created.append(product)
+            elif changed:
+                updated.append(product)
+            else:
+                self.stats['unchanged'] += 1
+
+        with transaction.atomic():
+            Product.objects.bulk_create(created)
+            Product.objects.bulk_update(updated, UPDATE_FIELDS)
+            self.write_listings(created + updated)
+            search.index_products(created + updated)
+        self.stats['created'] += len(created)
+        self.stats['updated'] += len(updated)
+
+    def write_listings(self, products):
+        ProductListing.objects.filter(product__in=[p.pk for p in products if not p.is_active]).delete()
+        ProductListing.objects.bulk_create(
+            [build_listing(product) for product in products if product.is_active],
+            update_conflicts=True, unique_fields=['product'], update_fields=LISTING_UPDATE_FIELDS,
+        )
+
+
+def import_catalog(rows, image_root='', batch_size=BATCH_SIZE, workers=4):
+    """Create or update products from rows; returns (stats, errors)"""
+    importer = CatalogImporter(image_root, batch_size, workers)
+    importer.run(rows)
+    return importer.stats, importer.errors
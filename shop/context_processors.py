@@ -1,6 +1,5 @@
-from .models import Category
+from .caching import get_active_categories
 
 def categories_processor(request):
     """Make categories available globally in templates"""
-    categories = Category.objects.filter(is_active=True)
-    return {'categories': categories}
+    return {'categories': get_active_categories(request)}
@@ -0,0 +1,260 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import (
+    Case, Count, DecimalField, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Cast, Coalesce, Round
+
+from .models import Category, Product, ProductListing, Review
+
+logger = logging.getLogger(__name__)
+
+VIEW_FLUSH_INTERVAL = getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 10)
+
+
+def _adjust_category(category_id, delta):
+    if not category_id or not delta:
+        return
+    categories = Category.objects.filter(pk=category_id)
+    if delta < 0:
+        categories = categories.filter(product_count__gte=-delta)
+    categories.update(product_count=F('product_count') + delta)
+
+
+def product_counted_state(product):
+    """(category_id, is_active) as stored in the database, or None for a new row.
+
+    Read under a row lock rather than taken from the instance, which may be a
+    copy loaded before another save moved the product.
+    """
+    if product.pk is None:
+        return None
+    return (
+        Product.objects.select_for_update().filter(pk=product.pk)
+        .values_list('category_id', 'is_active').first()
+    )
+
+
+def sync_category_counts(old_state, product):
+    """Move a product's contribution from its previous (category, active) state to the current one.
+
+    Returns True when any counter changed.
+    """
+    new_state = (product.category_id, product.is_active)
+    product._counted_state = new_state
+    old_category = old_state[0] if old_state and old_state[1] else None
+    new_category = new_state[0] if new_state[1] else None
+    if old_category == new_category:
+        return False
+    _adjust_category(old_category, -1)
+    _adjust_category(new_category, 1)
+    return True
+
+
+def release_category_count(product):
+    state = getattr(product, '_counted_state', None) or (product.category_id, product.is_active)
+    if state[0] and state[1]:
+        _adjust_category(state[0], -1)
+        return True
+    return False
+
+
+def recount_categories():
+    """Recompute every category's active-product counter in one UPDATE"""
+    active_counts = (
+        Product.objects.filter(category=OuterRef('pk'), is_active=True)
+        .order_by()
+        .values('category')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Category.objects.update(product_count=Coalesce(Subquery(active_counts), 0))
+
+
+# Average of the approved ratings, from the stored totals
+RATING = Case(
+    When(rating_count=0, then=Value(Decimal('0'))),
+    default=Round(Cast('rating_sum', FloatField()) / F('rating_count'), 2),
+    output_field=DecimalField(max_digits=3, decimal_places=2),
+)
+
+
+def refresh_ratings(product_ids=None):
+    """Re-derive `rating` from the totals and copy both onto the listing rows"""
+    products = Product.objects.all() if product_ids is None else Product.objects.filter(pk__in=product_ids)
+    products.update(rating=RATING)
+    listings = ProductListing.objects.all() if product_ids is None else ProductListing.objects.filter(pk__in=product_ids)
+    source = Product.objects.filter(pk=OuterRef('pk'))
+    listings.update(
+        rating=Subquery(source.values('rating')[:1]),
+        rating_count=Subquery(source.values('rating_count')[:1]),
+    )
+
+
+def review_rated_state(review):
+    """(product_id, rating, is_approved) as last written to the database, or None for a new row"""
+    state = getattr(review, '_rated_state', None)
+    if state is None and review.pk is not None:
+        state = Review.objects.filter(pk=review.pk).values_list('product_id', 'rating', 'is_approved').first()
+    return state
+
+
+def _rating_contribution(state):
+    return (state[0], int(state[1])) if state and state[2] else None
+
+
+def _adjust_rating(product_id, rating, count):
+    Product.objects.filter(pk=product_id).update(
+        rating_sum=F('rating_sum') + rating, rating_count=F('rating_count') + count,
+    )
+
+
+def sync_product_rating(old_state, review):
+    """Move a review's contribution from its previous state to the current one.
+
+    Only approved reviews count. Returns True when any product's rating changed.
+    """
+    new_state = (review.product_id, review.rating, review.is_approved)
+    review._rated_state = new_state
+    old, new = _rating_contribution(old_state), _rating_contribution(new_state)
+    if old == new:
+        return False
+    if old:
+        _adjust_rating(old[0], -old[1], -1)
+    if new:
+        _adjust_rating(new[0], new[1], 1)
+    refresh_ratings({contribution[0] for contribution in (old, new) if contribution})
+    return True
+
+
+def release_review_rating(review):
+    contribution = _rating_contribution(getattr(review, '_rated_state', None) or
+                                        (review.product_id, review.rating, review.is_approved))
+    if not contribution:
+        return False
+    _adjust_rating(contribution[0], -contribution[1], -1)
+    refresh_ratings([contribution[0]])
+    return True
+
+
+def recount_ratings(batch_size=500):
+    """Rebuild every product's rating totals from one grouped aggregate over approved reviews"""
+    totals = {
+        row['product']: (row['total'], row['count'])
+        for row in Review.objects.filter(is_approved=True).order_by()
+        .values('product').annotate(total=Sum('rating'), count=Count('pk'))
+    }
+    with transaction.atomic():
+        changed = []
+        for product in Product.objects.only('pk', 'rating_sum', 'rating_count').iterator(chunk_size=batch_size):
+            rating_sum, rating_count = totals.get(product.pk, (0, 0))
+            if (product.rating_sum, product.rating_count) != (rating_sum, rating_count):
+                product.rating_sum, product.rating_count = rating_sum, rating_count
+                changed.append(product)
+        Product.objects.bulk_update(changed, ['rating_sum', 'rating_count'], batch_size=batch_size)
+        refresh_ratings()
+    return len(changed)
+
+
+def bulk_increment(model, field, deltas, key='pk'):
+    """Add a per-row amount to a counter column with a single UPDATE ... CASE.
+
+    ``deltas`` maps values of ``key`` to the amount to add.
+    """
+    deltas = {value: amount for value, amount in deltas.items() if amount}
+    if not deltas:
+        return 0
+    amount = Case(
+        *[When(**{key: value}, then=Value(delta)) for value, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    return model.objects.filter(**{f'{key}__in': list(deltas)}).update(**{field: F(field) + amount})
+
+
+class CounterBuffer:
+    """Collect counter increments in memory and write them in one batched UPDATE.
+
+    A background thread flushes every ``interval`` seconds; register
+    ``flush_at_exit`` with atexit to write what is left when the process ends.
+    """
+
+    def __init__(self, model, field, interval, key='pk'):
+        self.model = model
+        self.field = field
+        self.interval = interval
+        self.key = key
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+
+    def add(self, key, amount=1):
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker starts with an empty buffer and needs its own flusher
+                self._pid = os.getpid()
+                self._pending = Counter()
+                self._thread = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'{self.field}-flusher', daemon=True)
+                self._thread.start()
+            self._pending[key] += amount
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return 0
+        try:
+            return bulk_increment(self.model, self.field, pending, key=self.key)
+        except Exception:
+            # Keep the hits for the next attempt rather than dropping them
+            with self._lock:
+                self._pending.update(pending)
+            raise
+
+    def discard(self):
+        """Drop the pending increments without writing them; returns how many were dropped"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        return sum(pending.values())
+
+    def flush_at_exit(self):
+        if not self._pending:
+            return
+        try:
+            connection.ensure_connection()
+            if not connection.is_usable():
+                raise DatabaseError('connection is not usable')
+            self.flush()
+        except DatabaseError as exc:
+            logger.warning("Dropped %d pending %s increments at exit: %s", self.discard(), self.field, exc)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not flush %s", self.field)
+            finally:
+                connection.close()
+
+
+# Keyed by slug so views served from the page cache can be counted without a query
+product_views = CounterBuffer(Product, 'views_count', VIEW_FLUSH_INTERVAL, key='slug')
+atexit.register(product_views.flush_at_exit)
+
+
+def record_product_view(slug):
+    product_views.add(slug)
+
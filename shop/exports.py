@@ -0,0 +1,83 @@
+"""Streaming order exports for the admin.
+
+Orders are read in chunks with their items prefetched per chunk, and each
+line is sent as soon as it is formatted, so memory stays flat however many
+orders are exported.
+"""
+import csv
+import json
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+EXPORT_CHUNK_SIZE = 2000
+
+ORDER_COLUMNS = [
+    'order_number', 'created_at', 'status', 'username', 'email',
+    'phone_number', 'shipping_address', 'total_amount',
+]
+ITEM_COLUMNS = ['product_id', 'product_name', 'custom_design_id', 'quantity', 'price']
+
+
+class Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller"""
+
+    def write(self, value):
+        return value
+
+
+def export_orders(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield (order values, [item values]) with one query per chunk of orders and one for their items"""
+    orders = queryset.select_related('user').prefetch_related('items').order_by('pk')
+    for order in orders.iterator(chunk_size=chunk_size):
+        values = {
+            'order_number': order.order_number,
+            'created_at': order.created_at.isoformat(),
+            'status': order.status,
+            'username': order.user.username,
+            'email': order.user.email,
+            'phone_number': order.phone_number,
+            'shipping_address': order.shipping_address,
+            'total_amount': str(order.total_amount),
+        }
+        items = [
+            {
+                'product_id': item.product_id,
+                'product_name': item.product_name,
+                'custom_design_id': item.custom_design_id,
+                'quantity': item.quantity,
+                'price': str(item.price),
+            }
+            for item in sorted(order.items.all(), key=lambda item: item.pk)
+        ]
+        yield values, items
+
+
+def order_csv_lines(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """One CSV row per order item; orders without items get a single row with empty item columns"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(ORDER_COLUMNS + ITEM_COLUMNS)
+    for order, items in export_orders(queryset, chunk_size):
+        row = [order[column] for column in ORDER_COLUMNS]
+        for item in items or [dict.fromkeys(ITEM_COLUMNS, '')]:
+            yield writer.writerow(row + [item[column] for column in ITEM_COLUMNS])
+
+
+def order_jsonl_lines(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """One JSON document per order, with its items nested"""
+    for order, items in export_orders(queryset, chunk_size):
+        yield json.dumps({**order, 'items': items}, ensure_ascii=False) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (order_csv_lines, 'text/csv; charset=utf-8'),
+    'jsonl': (order_jsonl_lines, 'application/x-ndjson; charset=utf-8'),
+}
+
+
+def order_export_response(queryset, fmt):
+    lines, content_type = EXPORT_FORMATS[fmt]
+    response = StreamingHttpResponse(lines(queryset), content_type=content_type)
+    filename = f"orders-{timezone.now():%Y%m%d-%H%M%S}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
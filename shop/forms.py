@@ -40,6 +40,11 @@ class CustomDesignForm(forms.ModelForm):
             'notes': forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'Any special instructions or notes...'}),
         }
 
+class CustomDesignDetailsForm(CustomDesignForm):
+    """The design options sent with a chunked upload once the file is on the server"""
+    class Meta(CustomDesignForm.Meta):
+        fields = ['framed', 'size', 'phone_number', 'notes']
+
 class ReviewForm(forms.ModelForm):
     class Meta:
         model = Review
@@ -50,6 +55,9 @@ class ReviewForm(forms.ModelForm):
         }
 
 class OrderForm(forms.ModelForm):
+    # Issued with the checkout page so a resubmitted form maps back to the same order
+    checkout_token = forms.CharField(max_length=64, required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = Order
         fields = ['shipping_address', 'phone_number']
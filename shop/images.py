@@ -0,0 +1,104 @@
+import hashlib
+import io
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# name -> target width in pixels; images are never upscaled
+DERIVATIVE_SIZES = {
+    'thumb': 160,
+    'card': 480,
+    'detail': 1200,
+}
+# extension -> (Pillow format, save options)
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+def derivative_name(image_hash, size, ext):
+    return f'derivatives/{image_hash[:2]}/{image_hash}/{size}.{ext}'
+
+
+def derivative_url(image_hash, size, ext):
+    return default_storage.url(derivative_name(image_hash, size, ext))
+
+
+def hash_file(field_file):
+    digest = hashlib.sha256()
+    field_file.open('rb')
+    try:
+        for chunk in field_file.chunks():
+            digest.update(chunk)
+    finally:
+        field_file.close()
+    return digest.hexdigest()
+
+
+def oriented_width(image):
+    """Width once EXIF rotation is applied, read from the header without decoding the pixels"""
+    # Orientations 5-8 turn the image by 90 degrees
+    return image.height if image.getexif().get(0x0112, 1) in (5, 6, 7, 8) else image.width
+
+
+def generate_derivatives(field_file, force=False):
+    """Write every size/format of an uploaded image; returns (content hash, original width)"""
+    image_hash = hash_file(field_file)
+    names = {
+        (size, ext): derivative_name(image_hash, size, ext)
+        for size in DERIVATIVE_SIZES for ext in DERIVATIVE_FORMATS
+    }
+    field_file.open('rb')
+    try:
+        with Image.open(field_file) as original:
+            width = oriented_width(original)
+            if not force and all(default_storage.exists(name) for name in names.values()):
+                return image_hash, width
+            original = ImageOps.exif_transpose(original)
+            if original.mode not in ('RGB', 'RGBA'):
+                original = original.convert('RGBA' if 'A' in original.getbands() else 'RGB')
+            for size, target in DERIVATIVE_SIZES.items():
+                resized = original
+                if original.width > target:
+                    height = max(1, round(original.height * target / original.width))
+                    resized = original.resize((target, height), Image.Resampling.LANCZOS)
+                for ext, (fmt, options) in DERIVATIVE_FORMATS.items():
+                    image = resized.convert('RGB') if fmt == 'JPEG' else resized
+                    buffer = io.BytesIO()
+                    image.save(buffer, fmt, **options)
+                    name = names[(size, ext)]
+                    if default_storage.exists(name):
+                        default_storage.delete(name)
+                    default_storage.save(name, ContentFile(buffer.getvalue()))
+    finally:
+        field_file.close()
+    return image_hash, width
+
+
+def process_image(model, pk, force=False):
+    """Build derivatives for one Product or Category and record the hash"""
+    from .caching import bump_version
+    from .models import Product, ProductListing
+
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not instance.image:
+        return None
+    image_hash, width = generate_derivatives(instance.image, force=force)
+    # Only record the hash if the image was not replaced in the meantime
+    updated = model.objects.filter(pk=pk, image=instance.image.name).update(image_hash=image_hash, image_width=width)
+    if updated:
+        if model is Product:
+            ProductListing.objects.filter(pk=pk).update(image_hash=image_hash, image_width=width)
+        else:
+            bump_version('categories')
+        bump_version('catalog')
+    return image_hash
+
+
+def schedule_derivatives(instance):
+    """Queue derivative generation; the task only becomes visible once the current transaction commits"""
+    from .tasks import build_image_derivatives
+
+    label = instance._meta.label
+    build_image_derivatives.enqueue(args=(label, instance.pk), unique_key=f'derivatives:{label}:{instance.pk}')
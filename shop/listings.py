@@ -0,0 +1,218 @@
+from collections import Counter
+from decimal import Decimal
+
+from django.db.models import Count
+
+from .models import Product, ProductListing
+
+
+def build_listing(product):
+    """Build the (unsaved) listing row for a product"""
+    category = product.category
+    return ProductListing(
+        product=product,
+        name=product.name,
+        slug=product.slug,
+        price=product.final_price,
+        size=product.size,
+        size_label=product.get_size_display(),
+        framed=product.framed,
+        frame_label='Framed' if product.framed else 'Frameless',
+        category_name=category.name if category else '',
+        category_slug=category.slug if category else '',
+        image_url=product.image.url if product.image else '',
+        image_hash=product.image_hash if product.image else '',
+        image_width=product.image_width if product.image else None,
+        featured=product.featured,
+        rating=product.rating,
+        rating_count=product.rating_count,
+        created_at=product.created_at,
+    )
+
+
+# Kept current by counters.refresh_ratings, so a product save must not write back its copy
+LISTING_COUNTER_FIELDS = ('rating', 'rating_count')
+
+
+def refresh_listing(product):
+    """Create, update or drop the listing row so it mirrors the product"""
+    if not product.is_active:
+        ProductListing.objects.filter(product_id=product.pk).delete()
+        return
+    listing = build_listing(product)
+    values = {
+        field.attname: getattr(listing, field.attname)
+        for field in ProductListing._meta.concrete_fields
+        if not field.primary_key and field.name not in LISTING_COUNTER_FIELDS
+    }
+    if not ProductListing.objects.filter(pk=product.pk).update(**values):
+        listing.save(force_insert=True)
+
+
+def refresh_category_listings(category):
+    ProductListing.objects.filter(
+        product_id__in=Product.objects.filter(category=category).values('id')
+    ).update(category_name=category.name, category_slug=category.slug)
+
+
+def clear_category_listings(category_slug):
+    ProductListing.objects.filter(category_slug=category_slug).update(category_name='', category_slug='')
+
+
+def rebuild_listings(batch_size=500):
+    """Recreate the whole read model from the Product table"""
+    ProductListing.objects.all().delete()
+    products = Product.objects.filter(is_active=True).select_related('category')
+    batch = []
+    count = 0
+    for product in products.iterator(chunk_size=batch_size):
+        batch.append(build_listing(product))
+        if len(batch) >= batch_size:
+            ProductListing.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        ProductListing.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+# sort parameter -> ORDER BY; each ends in the primary key so keyset cursors stay unique
+SORT_ORDERINGS = {
+    'newest': ('-created_at', '-product_id'),
+    'name': ('name', 'product_id'),
+    '-name': ('-name', '-product_id'),
+    'price': ('price', 'product_id'),
+    '-price': ('-price', '-product_id'),
+    'rating': ('-rating', '-rating_count', '-product_id'),
+}
+DEFAULT_SORT = 'newest'
+
+PRICE_RANGES = [
+    ('0-50', 'Under 50 LE', Decimal('0'), Decimal('50')),
+    ('50-100', '50 - 100 LE', Decimal('50'), Decimal('100')),
+    ('100-', '100 LE and above', Decimal('100'), None),
+]
+# minimum average rating filter values
+RATING_THRESHOLDS = [4, 3, 2, 1]
+
+def parse_filters(params):
+    """Pull the supported facet filters out of a QueryDict, dropping invalid values"""
+    filters = {}
+    category = params.get('category')
+    if category:
+        filters['category'] = category
+    size = params.get('size')
+    if size in dict(Product.SIZE_CHOICES):
+        filters['size'] = size
+    framed = params.get('framed')
+    if framed in ('1', '0'):
+        filters['framed'] = framed == '1'
+    price = params.get('price')
+    if price and price in {key for key, *_ in PRICE_RANGES}:
+        filters['price'] = price
+    rating = params.get('rating')
+    if rating in {str(threshold) for threshold in RATING_THRESHOLDS}:
+        filters['rating'] = int(rating)
+    return filters
+
+
+def _price_bounds(key):
+    for range_key, _, low, high in PRICE_RANGES:
+        if range_key == key:
+            return low, high
+    return None, None
+
+
+def apply_filters(queryset, filters, exclude=None):
+    for name, value in filters.items():
+        if name == exclude:
+            continue
+        if name == 'category':
+            queryset = queryset.filter(category_slug=value)
+        elif name == 'size':
+            queryset = queryset.filter(size=value)
+        elif name == 'framed':
+            queryset = queryset.filter(framed=value)
+        elif name == 'price':
+            low, high = _price_bounds(value)
+            queryset = queryset.filter(price__gte=low)
+            if high is not None:
+                queryset = queryset.filter(price__lt=high)
+        elif name == 'rating':
+            queryset = queryset.filter(rating__gte=value)
+    return queryset
+
+
+def _row_matches(row, filters, exclude):
+    for name, value in filters.items():
+        if name == exclude:
+            continue
+        if name == 'category' and row['category_slug'] != value:
+            return False
+        if name == 'size' and row['size'] != value:
+            return False
+        if name == 'framed' and row['framed'] != value:
+            return False
+        if name == 'price':
+            low, high = _price_bounds(value)
+            if row['price'] < low or (high is not None and row['price'] >= high):
+                return False
+        if name == 'rating' and row['rating'] < value:
+            return False
+    return True
+
+
+def facet_counts(queryset, filters):
+    """Count matches per facet value with a single grouped query.
+
+    Each facet is counted against every active filter except its own, so
+    choosing a size still shows how many products exist in the other sizes.
+    """
+    rows = list(
+        queryset.order_by()
+        .values('category_slug', 'category_name', 'size', 'size_label', 'framed', 'price', 'rating')
+        .annotate(count=Count('pk'))
+    )
+    counts = {name: Counter() for name in ('category', 'size', 'framed', 'price', 'rating')}
+    labels = {'category': {}, 'size': {}, 'framed': {'1': 'Framed', '0': 'Frameless'}}
+    for row in rows:
+        if row['category_slug'] and _row_matches(row, filters, 'category'):
+            counts['category'][row['category_slug']] += row['count']
+            labels['category'][row['category_slug']] = row['category_name']
+        if _row_matches(row, filters, 'size'):
+            counts['size'][row['size']] += row['count']
+            labels['size'][row['size']] = row['size_label']
+        if _row_matches(row, filters, 'framed'):
+            counts['framed']['1' if row['framed'] else '0'] += row['count']
+        if _row_matches(row, filters, 'price'):
+            for key, _, low, high in PRICE_RANGES:
+                if row['price'] >= low and (high is None or row['price'] < high):
+                    counts['price'][key] += row['count']
+                    break
+        if _row_matches(row, filters, 'rating'):
+            # Thresholds overlap: a 4.5 product counts towards "4 & up" and "3 & up"
+            for threshold in RATING_THRESHOLDS:
+                if row['rating'] >= threshold:
+                    counts['rating'][threshold] += row['count']
+
+    def as_list(name):
+        return sorted(
+            ({'value': value, 'label': labels[name][value], 'count': count}
+             for value, count in counts[name].items()),
+            key=lambda facet: facet['label'],
+        )
+
+    return {
+        'categories': as_list('category'),
+        'sizes': as_list('size'),
+        'frames': as_list('framed'),
+        'prices': [
+            {'value': key, 'label': label, 'count': counts['price'][key]}
+            for key, label, *_ in PRICE_RANGES
+        ],
+        'ratings': [
+            {'value': str(threshold), 'label': f"{threshold} star{'s' if threshold > 1 else ''} & up", 'count': counts['rating'][threshold]}
+            for threshold in RATING_THRESHOLDS
+        ],
+    }
@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from shop.benchmark import BenchmarkError, run_benchmark
+
+
+class Command(BaseCommand):
+    help = "Benchmark every shop and cart route through the test client and write the results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help="Measured requests per route")
+        parser.add_argument('--warmup', type=int, default=2, help="Unmeasured requests per route first")
+        parser.add_argument('--only', help="Only routes whose name contains this")
+        parser.add_argument('--cold-cache', action='store_true',
+                            help="Invalidate the page and count caches before every request")
+        parser.add_argument('--output', default='benchmark-results.json', help="JSON report path")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1")
+        # Lets the test client through ALLOWED_HOSTS and keeps mail in memory
+        setup_test_environment()
+        self.stdout.write(f"{'route':<32} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8}  status")
+        try:
+            report = run_benchmark(
+                options['iterations'], options['warmup'], options['only'], options['cold_cache'], self.progress,
+            )
+        except BenchmarkError as exc:
+            raise CommandError(str(exc))
+        finally:
+            teardown_test_environment()
+
+        with open(options['output'], 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+        self.stdout.write(self.style.SUCCESS(
+            f"Benchmarked {len(report['results'])} routes in {report['meta']['seconds']:.1f}s; "
+            f"wrote {options['output']}"
+        ))
+
+    def progress(self, name, result):
+        latency = result['latency_ms']
+        statuses = ', '.join(f"{code}x{count}" for code, count in result['status'].items())
+        self.stdout.write(
+            f"{name:<32} {latency['p50']:>9.2f} {latency['p95']:>9.2f} {result['queries']['median']:>8}  {statuses}"
+        )
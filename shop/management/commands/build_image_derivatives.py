@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from shop.images import process_image
+from shop.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = "Generate responsive image derivatives for existing product and category images"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate derivatives that already exist")
+        parser.add_argument('--workers', type=int, default=4, help="Number of images processed in parallel")
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model in (Product, Category):
+            pending = model.objects.exclude(image='').exclude(image__isnull=True)
+            if not options['force']:
+                # Rows from before widths were recorded only need the width read from the header
+                pending = pending.filter(Q(image_hash='') | Q(image_width__isnull=True))
+            jobs.extend((model, pk) for pk in pending.values_list('pk', flat=True))
+
+        def run(model, pk):
+            try:
+                return process_image(model, pk, force=options['force'])
+            finally:
+                connection.close()
+
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(run, model, pk): (model, pk) for model, pk in jobs}
+            for future in as_completed(futures):
+                model, pk = futures[future]
+                try:
+                    future.result()
+                    done += 1
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} {pk}: {exc}")
+        self.stdout.write(self.style.SUCCESS(f"Processed {done} images ({failed} failed)"))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.recommendations import TOP_K, build_recommendations
+
+
+class Command(BaseCommand):
+    help = "Rebuild product recommendations from order history, falling back to category best-sellers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=TOP_K, help="Recommendations kept per product")
+        parser.add_argument('--min-count', type=int, default=1,
+                            help="Orders two products must share before they are recommended together")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        products, copurchase, fallback = build_recommendations(options['top_k'], options['min_count'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {copurchase} co-purchase and {fallback} category recommendations "
+            f"for {products} products in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,111 @@
+import os
+import shutil
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shop.models import StoredBlob
+from shop.storage import BLOB_DIR, blob_name, content_addressed_fields, file_sha256, recount_blobs
+
+# Trees that are already keyed by content hash
+SKIP_DIRS = {BLOB_DIR, 'derivatives'}
+
+
+def _link(source, target):
+    """Make `target` a hard link to `source`, atomically replacing it"""
+    temp = f'{target}.dedupe'
+    try:
+        os.link(source, temp)
+    except OSError:
+        return False
+    os.replace(temp, target)
+    return True
+
+
+class Command(BaseCommand):
+    help = (
+        "Deduplicate the existing media tree in place: files of content-addressed fields "
+        "move into the blob store and other identical files are hard-linked together"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        moved, saved = self.import_into_blobs(dry_run)
+        linked, linked_saved = self.link_duplicates(dry_run)
+        verb = "Would save" if dry_run else "Saved"
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} files into the blob store, hard-linked {linked} duplicates. "
+            f"{verb} {(saved + linked_saved) / (1024 * 1024):.1f} MB"
+        ))
+
+    def import_into_blobs(self, dry_run):
+        moved = saved = 0
+        for model, field in content_addressed_fields():
+            storage = field.storage
+            legacy_paths = set()
+            seen = set()
+            rows = (
+                model._default_manager.exclude(**{field.name: ''})
+                .exclude(**{f'{field.name}__startswith': f'{BLOB_DIR}/'})
+                .values_list('pk', field.name)
+            )
+            for pk, name in list(rows):
+                path = storage.path(name)
+                if not os.path.exists(path):
+                    self.stderr.write(f"Missing file for {model.__name__} {pk}: {name}")
+                    continue
+                sha256 = file_sha256(path)
+                new_name = blob_name(sha256, os.path.splitext(name)[1].lower())
+                size = os.path.getsize(path)
+                if path not in legacy_paths and (new_name in seen or storage.exists(new_name)):
+                    saved += size
+                seen.add(new_name)
+                moved += 1
+                legacy_paths.add(path)
+                if dry_run:
+                    continue
+                if not storage.exists(new_name):
+                    os.makedirs(os.path.dirname(storage.path(new_name)), exist_ok=True)
+                    shutil.copy2(path, storage.path(new_name))
+                StoredBlob.objects.get_or_create(name=new_name, defaults={'sha256': sha256, 'size': size})
+                # A queryset update skips signals, which would otherwise juggle references
+                model._default_manager.filter(pk=pk).update(**{field.name: new_name})
+
+            if not dry_run:
+                for path in legacy_paths:
+                    os.remove(path)
+        if not dry_run:
+            recount_blobs()
+        return moved, saved
+
+    def link_duplicates(self, dry_run):
+        by_size = defaultdict(list)
+        root = settings.MEDIA_ROOT
+        for dirpath, dirnames, filenames in os.walk(root):
+            if dirpath == root:
+                dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if not os.path.islink(path):
+                    by_size[os.path.getsize(path)].append(path)
+
+        linked = saved = 0
+        for size, paths in by_size.items():
+            if len(paths) < 2 or size == 0:
+                continue
+            by_hash = defaultdict(list)
+            for path in paths:
+                by_hash[file_sha256(path)].append(path)
+            for same in by_hash.values():
+                keep = same[0]
+                for path in same[1:]:
+                    if os.stat(path).st_ino == os.stat(keep).st_ino:
+                        continue
+                    if dry_run or _link(keep, path):
+                        linked += 1
+                        saved += size
+        return linked, saved
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from shop.storage import collect_garbage, recount_blobs
+
+
+class Command(BaseCommand):
+    help = "Delete content-addressed blobs that no row references any more"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true', help="Recompute reference counts from the database first")
+        parser.add_argument('--grace-hours', type=int, default=24, help="Keep unreferenced blobs younger than this")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            changed = recount_blobs()
+            self.stdout.write(f"Corrected {changed} reference counts")
+        removed, freed = collect_garbage(grace=timedelta(hours=options['grace_hours']), dry_run=options['dry_run'])
+        verb = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} blobs ({freed / (1024 * 1024):.1f} MB)"))
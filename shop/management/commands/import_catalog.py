@@ -0,0 +1,37 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog_import import BATCH_SIZE, import_catalog, read_rows
+
+MAX_ERRORS_SHOWN = 20
+
+
+class Command(BaseCommand):
+    help = "Create or update products from a CSV or JSON file, matched by SKU"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV with a header row, or a JSON list of objects")
+        parser.add_argument('--image-root', default=None,
+                            help="Directory that relative image paths are resolved against (default: the file's)")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Rows written per transaction")
+        parser.add_argument('--workers', type=int, default=4, help="Images processed in parallel")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"No such file: {path}")
+        image_root = options['image_root'] or os.path.dirname(os.path.abspath(path))
+
+        started = time.perf_counter()
+        stats, errors = import_catalog(read_rows(path), image_root, options['batch_size'], options['workers'])
+        for error in errors[:MAX_ERRORS_SHOWN]:
+            self.stderr.write(error)
+        if len(errors) > MAX_ERRORS_SHOWN:
+            self.stderr.write(f"... and {len(errors) - MAX_ERRORS_SHOWN} more errors")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported catalog in {time.perf_counter() - started:.1f}s: {stats['created']} created, "
+            f"{stats['updated']} updated, {stats['unchanged']} unchanged, {stats['skipped']} skipped, "
+            f"{stats['categories']} new categories, {stats['image_errors']} image errors"
+        ))
@@ -0,0 +1,73 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from shop.models import CustomDesign
+from shop.printing import (
+    BLEED_MM, FRAME_SAFE_MM, PRINT_DPI, PRINT_FORMATS, PrintSettings,
+    design_hash, output_path, prepare_job, print_file_name,
+)
+
+
+class Command(BaseCommand):
+    help = "Render print-ready files for custom designs in parallel, reusing cached output"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', default='processing', help="Designs in this status are prepared")
+        parser.add_argument('--format', dest='fmt', choices=sorted(PRINT_FORMATS), default='pdf')
+        parser.add_argument('--dpi', type=int, default=PRINT_DPI)
+        parser.add_argument('--bleed-mm', type=float, default=BLEED_MM)
+        parser.add_argument('--safe-mm', type=float, default=FRAME_SAFE_MM, help="Margin kept clear of the frame")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Processes to render with")
+        parser.add_argument('--force', action='store_true', help="Render again even when a cached file exists")
+
+    def handle(self, *args, **options):
+        settings = PrintSettings(options['fmt'], options['dpi'], options['bleed_mm'], options['safe_mm'])
+        designs = CustomDesign.objects.filter(status=options['status']).exclude(design_file='')
+
+        # Designs sharing artwork, size and frame option share one print file
+        jobs = {}
+        for design in designs.iterator():
+            try:
+                name = print_file_name(design_hash(design.design_file), design.size, design.framed, settings)
+            except OSError as exc:
+                self.stderr.write(f"Design {design.pk}: {exc}")
+                continue
+            job = jobs.setdefault(name, {'source': design.design_file.path, 'size': design.size,
+                                         'framed': design.framed, 'designs': []})
+            job['designs'].append(design.pk)
+
+        started = time.perf_counter()
+        rendered = cached = failed = pixels = 0
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(prepare_job, job['source'], output_path(name), job['size'], job['framed'],
+                            settings, options['force']): name
+                for name, job in jobs.items()
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                design_ids = ', '.join(str(pk) for pk in jobs[name]['designs'])
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"Design {design_ids}: {exc}")
+                    continue
+                if result.cached:
+                    cached += 1
+                else:
+                    rendered += 1
+                    pixels += result.pixels
+                self.stdout.write(f"Design {design_ids}: {name}{' (cached)' if result.cached else ''}")
+
+        elapsed = time.perf_counter() - started
+        rate = rendered / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(jobs)} print files in {elapsed:.1f}s: {rendered} rendered, {cached} cached, {failed} failed. "
+            f"{rate:.2f} files/s, {pixels / 1e6 / elapsed if elapsed else 0:.1f} MP/s with {options['workers']} workers"
+        ))
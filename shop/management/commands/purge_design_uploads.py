@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from shop.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete unfinished chunked design uploads that have not been touched for a while"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=48, help="Age after which an upload counts as abandoned")
+
+    def handle(self, *args, **options):
+        count = purge_stale_uploads(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f"Purged {count} abandoned uploads"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shop.listings import rebuild_listings
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized product listing table from the catalog"
+
+    def handle(self, *args, **options):
+        count = rebuild_listings()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} product listings"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from shop.search import backend_supported, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from scratch"
+
+    def handle(self, *args, **options):
+        if not backend_supported():
+            self.stdout.write(self.style.WARNING("This database has no full-text backend; searches use LIKE instead."))
+            return
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from shop.caching import bump_version
+from shop.counters import recount_categories
+
+
+class Command(BaseCommand):
+    help = "Recompute the active product counter of every category"
+
+    def handle(self, *args, **options):
+        count = recount_categories()
+        bump_version('categories')
+        self.stdout.write(self.style.SUCCESS(f"Recounted {count} categories"))
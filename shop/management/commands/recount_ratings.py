@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from shop.caching import bump_version
+from shop.counters import recount_ratings
+
+
+class Command(BaseCommand):
+    help = "Rebuild every product's rating totals from the approved reviews"
+
+    def handle(self, *args, **options):
+        count = recount_ratings()
+        bump_version('catalog')
+        self.stdout.write(self.style.SUCCESS(f"Corrected the rating of {count} products"))
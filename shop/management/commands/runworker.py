@@ -0,0 +1,89 @@
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils.module_loading import autodiscover_modules
+
+from shop.models import Task
+from shop.taskqueue import (
+    claim_tasks, execute_task, heartbeat, prune_finished, queue_periodic_tasks, requeue_stale,
+)
+
+MAINTENANCE_INTERVAL = 60
+HEARTBEAT_INTERVAL = 15
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks in a thread or process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help="Tasks run at the same time")
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help="Use processes for CPU-bound work such as image processing")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between polls when idle")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty")
+        parser.add_argument('--stale-after', type=int, default=120,
+                            help="Seconds without a heartbeat after which a running task's worker is assumed dead")
+        parser.add_argument('--keep-days', type=int, default=7, help="Days to keep finished tasks")
+
+    def handle(self, *args, **options):
+        autodiscover_modules('tasks')
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        concurrency = options['concurrency']
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+        # Forked children must not share the parent's database connection
+        connections.close_all()
+        pool_class = ProcessPoolExecutor if options['pool'] == 'process' else ThreadPoolExecutor
+        results = {Task.DONE: 0, Task.QUEUED: 0, Task.FAILED: 0}
+        inflight = set()
+        last_periodic = {}
+        last_maintenance = last_heartbeat = float('-inf')
+        self.stdout.write(f"Worker {worker} started with {concurrency} {options['pool']} workers")
+
+        with pool_class(max_workers=concurrency) as pool:
+            while not stop.is_set():
+                if inflight and time.monotonic() - last_heartbeat > HEARTBEAT_INTERVAL:
+                    heartbeat(worker)
+                    last_heartbeat = time.monotonic()
+                if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                    requeue_stale(timedelta(seconds=options['stale_after']))
+                    prune_finished(timedelta(days=options['keep_days']))
+                    last_maintenance = time.monotonic()
+                if not options['burst']:
+                    queue_periodic_tasks(last_periodic)
+
+                free = concurrency - len(inflight)
+                for task in claim_tasks(worker, free) if free else []:
+                    inflight.add(pool.submit(execute_task, task.pk))
+
+                if not inflight:
+                    if options['burst']:
+                        break
+                    stop.wait(options['poll_interval'])
+                    continue
+                done, inflight = wait(inflight, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                self.collect(done, results)
+
+            self.collect(wait(inflight).done, results)
+        connections.close_all()
+        self.stdout.write(self.style.SUCCESS(
+            f"Ran {sum(results.values())} tasks: {results[Task.DONE]} done, "
+            f"{results[Task.QUEUED]} to retry, {results[Task.FAILED]} failed"
+        ))
+
+    def collect(self, futures, results):
+        for future in futures:
+            try:
+                results[future.result()] += 1
+            except Exception as exc:
+                results[Task.FAILED] += 1
+                self.stderr.write(f"Worker error: {exc}")
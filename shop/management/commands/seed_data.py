@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.synthetic import PASSWORD, SCALES, USER_PREFIX, Scale, generate, has_synthetic_data, remove_synthetic_data
+
+
+class Command(BaseCommand):
+    help = "Fill the database with seeded synthetic users, products, reviews, orders and carts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='small', help="Preset volumes")
+        for field in Scale._fields:
+            parser.add_argument(f'--{field}', type=int, help=f"Override the preset number of {field}")
+        parser.add_argument('--seed', type=int, default=0, help="Same seed, same data")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--replace', action='store_true', help="Remove earlier synthetic data first")
+        parser.add_argument('--remove', action='store_true', help="Only remove synthetic data")
+
+    def handle(self, *args, **options):
+        if options['remove'] or options['replace']:
+            deleted = remove_synthetic_data()
+            self.stdout.write(f"Removed {deleted} synthetic rows")
+            if options['remove']:
+                return
+        elif has_synthetic_data():
+            raise CommandError("Synthetic data already exists; use --replace to regenerate it")
+
+        scale = SCALES[options['scale']]._replace(**{
+            field: options[field] for field in Scale._fields if options[field] is not None
+        })
+        started = time.perf_counter()
+        counts = generate(scale, seed=options['seed'], batch_size=options['batch_size'])
+        summary = ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Created {summary} in {time.perf_counter() - started:.1f}s"))
+        self.stdout.write(f"Synthetic users are {USER_PREFIX}000000 ... with password {PASSWORD!r}")
@@ -0,0 +1,215 @@
+"""Per-route request metrics, aggregated in-process and rendered in the Prometheus text format.
+
+MetricsMiddleware times each request, counts its SQL queries and their
+time through a connection execute_wrapper, and adds up template render
+time. Each process keeps its own totals; /metrics reports the process that
+serves the scrape.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.db import connections
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1024, 10 * 1024, 50 * 1024, 100 * 1024, 500 * 1024, 1024 * 1024, 5 * 1024 * 1024)
+UNMATCHED_ROUTE = 'unmatched'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # Per-bucket counts; made cumulative when rendered
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RouteMetrics:
+    __slots__ = ('latency', 'queries', 'sql_seconds', 'template_seconds', 'response_size')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_seconds = 0.0
+        self.template_seconds = Histogram(LATENCY_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+        # (route, method, status) -> requests
+        self.requests = {}
+        self.started = time.time()
+
+    def record(self, route, method, status, seconds, sample):
+        with self._lock:
+            metrics = self.routes.get(route)
+            if metrics is None:
+                metrics = self.routes[route] = RouteMetrics()
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            metrics.latency.observe(seconds)
+            metrics.queries.observe(sample.queries)
+            metrics.sql_seconds += sample.sql_seconds
+            metrics.template_seconds.observe(sample.template_seconds)
+            if sample.response_size is not None:
+                metrics.response_size.observe(sample.response_size)
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
+            self.requests = {}
+
+
+registry = Registry()
+
+
+class RequestSample:
+    """What one request has spent so far; filled in by the SQL wrapper and the template timer"""
+    __slots__ = ('queries', 'sql_seconds', 'template_seconds', 'template_depth', 'response_size')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+        self.response_size = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+_current = ContextVar('request_sample', default=None)
+
+
+def install_template_timer():
+    """Time the top-level render of every Django template rendered during a request"""
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, 'timed', False):
+        return
+    original = Template.render
+
+    def render(self, context=None, request=None):
+        sample = _current.get()
+        if sample is None or sample.template_depth:
+            return original(self, context, request)
+        sample.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            sample.template_seconds += time.perf_counter() - started
+            sample.template_depth -= 1
+
+    render.timed = True
+    Template.render = render
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNMATCHED_ROUTE
+    # URL names keep the label set small; fall back to the pattern for unnamed routes
+    return match.view_name or match.route or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_template_timer()
+
+    def __call__(self, request):
+        sample = RequestSample()
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(sample))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        elapsed = time.perf_counter() - started
+        if not response.streaming:
+            sample.response_size = len(response.content)
+        registry.record(route_name(request), request.method, str(response.status_code), elapsed, sample)
+        return response
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_lines(name, route, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+        cumulative += count
+        yield f'{name}_bucket{{{_labels(route=route, le=bound)}}} {cumulative}'
+    yield f'{name}_sum{{{_labels(route=route)}}} {_number(histogram.sum)}'
+    yield f'{name}_count{{{_labels(route=route)}}} {histogram.count}'
+
+
+HISTOGRAMS = [
+    ('rhino_http_request_duration_seconds', 'Time from the first middleware to the response', 'latency'),
+    ('rhino_db_queries_per_request', 'SQL statements executed per request', 'queries'),
+    ('rhino_template_render_seconds', 'Time spent rendering templates per request', 'template_seconds'),
+    ('rhino_http_response_size_bytes', 'Response body size, streaming responses excluded', 'response_size'),
+]
+
+
+def render_metrics(registry=registry):
+    """The registry in the Prometheus text exposition format"""
+    with registry._lock:
+        routes = sorted(registry.routes.items())
+        requests = sorted(registry.requests.items())
+        lines = [
+            '# HELP rhino_http_requests_total Requests handled, by route, method and status',
+            '# TYPE rhino_http_requests_total counter',
+        ]
+        for (route, method, status), count in requests:
+            lines.append(f'rhino_http_requests_total{{{_labels(route=route, method=method, status=status)}}} {count}')
+        for name, help_text, attr in HISTOGRAMS:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for route, metrics in routes:
+                lines.extend(_histogram_lines(name, route, getattr(metrics, attr)))
+        lines += [
+            '# HELP rhino_db_query_seconds_total Time spent in SQL, by route',
+            '# TYPE rhino_db_query_seconds_total counter',
+        ]
+        for route, metrics in routes:
+            lines.append(f'rhino_db_query_seconds_total{{{_labels(route=route)}}} {_number(metrics.sql_seconds)}')
+        lines += [
+            '# HELP rhino_process_start_time_seconds When this process started collecting',
+            '# TYPE rhino_process_start_time_seconds gauge',
+            f'rhino_process_start_time_seconds {_number(registry.started)}',
+        ]
+    return '\n'.join(lines) + '\n'
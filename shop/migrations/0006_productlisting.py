@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_listings(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductListing = apps.get_model('shop', 'ProductListing')
+    base_prices = {'A5': 25, 'A4': 30, 'A3': 35}
+    listings = []
+    for product in Product.objects.filter(is_active=True).select_related('category'):
+        category = product.category
+        listings.append(ProductListing(
+            product=product,
+            name=product.name,
+            slug=product.slug,
+            price=base_prices.get(product.size, 30) + (70 if product.framed else 0),
+            size=product.size,
+            size_label=product.get_size_display(),
+            framed=product.framed,
+            frame_label='Framed' if product.framed else 'Frameless',
+            category_name=category.name if category else '',
+            category_slug=category.slug if category else '',
+            image_url=product.image.url if product.image else '',
+            featured=product.featured,
+            created_at=product.created_at,
+        ))
+    ProductListing.objects.bulk_create(listings)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_promocode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductListing',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='shop.product')),
+                ('name', models.CharField(max_length=200)),
+                ('slug', models.SlugField(unique=True)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('size', models.CharField(max_length=10)),
+                ('size_label', models.CharField(max_length=50)),
+                ('framed', models.BooleanField(default=False)),
+                ('frame_label', models.CharField(max_length=20)),
+                ('category_name', models.CharField(blank=True, max_length=100)),
+                ('category_slug', models.SlugField(blank=True)),
+                ('image_url', models.CharField(blank=True, max_length=255)),
+                ('featured', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['-created_at'], name='listing_created_idx'), models.Index(fields=['featured', '-created_at'], name='listing_featured_idx'), models.Index(fields=['category_slug', '-created_at'], name='listing_category_idx')],
+            },
+        ),
+        migrations.RunPython(populate_listings, migrations.RunPython.noop),
+    ]
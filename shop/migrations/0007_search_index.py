@@ -0,0 +1,58 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS shop_search_index "
+            "USING fts5(name, category, description, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        insert = (
+            "INSERT INTO shop_search_index (rowid, name, category, description) "
+            "VALUES (%s, %s, %s, %s)"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE IF NOT EXISTS shop_search_index ("
+            "product_id bigint PRIMARY KEY REFERENCES shop_product (id) "
+            "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS shop_search_index_document_gin "
+            "ON shop_search_index USING GIN (document)"
+        )
+        insert = (
+            "INSERT INTO shop_search_index (product_id, document) VALUES (%s, "
+            "setweight(to_tsvector('simple', %s), 'A') || "
+            "setweight(to_tsvector('simple', %s), 'B') || "
+            "setweight(to_tsvector('simple', %s), 'C'))"
+        )
+    else:
+        return
+
+    Product = apps.get_model('shop', 'Product')
+    rows = [
+        (p.pk, p.name, p.category.name if p.category else '', p.description or '')
+        for p in Product.objects.filter(is_active=True).select_related('category')
+    ]
+    if rows:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(insert, rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS shop_search_index")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_productlisting'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='productlisting',
+            name='listing_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='productlisting',
+            name='listing_category_idx',
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['-created_at', '-product'], name='listing_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['category_slug', '-created_at', '-product'], name='listing_category_idx'),
+        ),
+    ]
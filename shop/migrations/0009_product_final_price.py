@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:18
+
+from django.db import migrations, models
+
+
+def fill_final_price(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    base_prices = {'A5': 25, 'A4': 30, 'A3': 35}
+    for size, price in base_prices.items():
+        Product.objects.filter(size=size, framed=False).update(final_price=price)
+        Product.objects.filter(size=size, framed=True).update(final_price=price + 70)
+    unknown = Product.objects.exclude(size__in=base_prices)
+    unknown.filter(framed=False).update(final_price=30)
+    unknown.filter(framed=True).update(final_price=100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_listing_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='final_price',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, max_digits=8),
+        ),
+        migrations.RunPython(fill_final_price, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['name', 'product'], name='listing_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['price', 'product'], name='listing_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['category_slug', 'name', 'product'], name='listing_category_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['category_slug', 'price', 'product'], name='listing_category_price_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:19
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_products(apps, schema_editor):
+    Category = apps.get_model('shop', 'Category')
+    counts = (
+        Category.objects
+        .annotate(active=Count('product', filter=models.Q(product__is_active=True)))
+        .values_list('pk', 'active')
+    )
+    for pk, active in counts:
+        Category.objects.filter(pk=pk).update(product_count=active)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_product_final_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_products, migrations.RunPython.noop),
+    ]
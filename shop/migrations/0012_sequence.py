@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:22
+
+from django.db import migrations, models
+
+
+def seed_order_numbers(apps, schema_editor):
+    Order = apps.get_model('shop', 'Order')
+    Sequence = apps.get_model('shop', 'Sequence')
+    highest = 0
+    for number in Order.objects.filter(order_number__startswith='RHINO').values_list('order_number', flat=True):
+        suffix = number[len('RHINO'):]
+        if suffix.isdigit():
+            highest = max(highest, int(suffix))
+    Sequence.objects.create(name='order_number', next_value=highest + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_order_checkout_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(seed_order_numbers, migrations.RunPython.noop),
+    ]
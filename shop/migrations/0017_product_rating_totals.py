@@ -0,0 +1,55 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:35
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def total_ratings(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductListing = apps.get_model('shop', 'ProductListing')
+    Review = apps.get_model('shop', 'Review')
+    totals = (
+        Review.objects.filter(is_approved=True).order_by()
+        .values('product').annotate(total=Sum('rating'), count=Count('pk'))
+    )
+    for row in totals:
+        rating = round(row['total'] / row['count'], 2)
+        Product.objects.filter(pk=row['product']).update(
+            rating_sum=row['total'], rating_count=row['count'], rating=rating,
+        )
+        ProductListing.objects.filter(pk=row['product']).update(rating=rating, rating_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productlisting',
+            name='rating',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='productlisting',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['-rating', '-rating_count', '-product'], name='listing_rating_idx'),
+        ),
+        migrations.RunPython(total_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def link_order_items(apps, schema_editor):
+    # Order items only kept the product name; link those whose name is unambiguous
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    Product = apps.get_model('shop', 'Product')
+    unique_names = (
+        Product.objects.order_by().values('name').annotate(n=Count('pk')).filter(n=1).values('name')
+    )
+    for pk, name in Product.objects.filter(name__in=unique_names).values_list('pk', 'name'):
+        OrderItem.objects.filter(product__isnull=True, custom_design__isnull=True, product_name=name).update(product=pk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_product_rating_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='shop.product'),
+        ),
+        migrations.CreateModel(
+            name='ProductRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField(default=0)),
+                ('source', models.CharField(choices=[('copurchase', 'Bought together'), ('category', 'Same category')], max_length=20)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='shop.product')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_in', to='shop.product')),
+            ],
+            options={
+                'ordering': ['product', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('product', 'rank'), name='recommendation_rank_unique')],
+            },
+        ),
+        migrations.RunPython(link_order_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# The admin searches with icontains, i.e. UPPER(column) LIKE '%term%', which
+# only a trigram index can serve
+TRIGRAM_INDEXES = [
+    ('shop_admin_user_email_trgm', 'auth_user', 'email'),
+    ('shop_admin_order_phone_trgm', 'shop_order', 'phone_number'),
+    ('shop_admin_design_phone_trgm', 'shop_customdesign', 'phone_number'),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING GIN (UPPER("{column}"::text) gin_trgm_ops)'
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('shop', '0019_order_history_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:23
+
+import shop.storage
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0024_task_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customdesign',
+            name='design_file',
+            field=shop.storage.BlobFileField(storage=shop.storage.ContentAddressedStorage(), upload_to='custom_designs/'),
+        ),
+    ]
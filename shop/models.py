@@ -1,15 +1,24 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.conf import settings
-from django.utils.text import slugify
+from django.utils import timezone
+
+from .slugs import unique_slug
+from .storage import BlobFileField, design_storage
 
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    image_hash = models.CharField(max_length=64, blank=True, editable=False)
+    # Of the original, upright; derivatives are never wider
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
     slug = models.SlugField(unique=True, blank=True)
     is_active = models.BooleanField(default=True)
+    product_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -19,9 +28,17 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if 'image' in loaded:
+            instance._loaded_image = loaded['image']
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = unique_slug(self, self.name)
         super().save(*args, **kwargs)
 
 
@@ -38,11 +55,19 @@ class Product(models.Model):
     ]
 
     name = models.CharField(max_length=200)
+    # Stock keeping unit; catalog imports match rows to products by it
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     description = models.TextField()
     base_price = models.DecimalField(max_digits=8, decimal_places=2)
+    final_price = models.DecimalField(max_digits=8, decimal_places=2, default=0, db_index=True, editable=False)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    image_hash = models.CharField(max_length=64, blank=True, editable=False)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.0)
+    # Approved reviews only; rating is derived from these two
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     framed = models.BooleanField(default=False)
@@ -56,6 +81,9 @@ class Product(models.Model):
     views_count = models.PositiveIntegerField(default=0)
     sales_count = models.PositiveIntegerField(default=0)
 
+    # Maintained with in-place UPDATEs; a full save() must not write back a stale copy
+    COUNTER_FIELDS = ('rating', 'rating_sum', 'rating_count', 'views_count', 'sales_count')
+
     class Meta:
         ordering = ['-created_at']
 
@@ -76,10 +104,97 @@ class Product(models.Model):
         
         return price
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if 'category_id' in loaded and 'is_active' in loaded:
+            # What the category counters currently account for this product
+            instance._counted_state = (loaded['category_id'], loaded['is_active'])
+        if 'image' in loaded:
+            instance._loaded_image = loaded['image']
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+            self.slug = unique_slug(self, self.name)
+        self.final_price = self.get_final_price()
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        # Keep the row and the post_save counter updates in one transaction
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        from .counters import product_counted_state
+
+        with transaction.atomic(using=kwargs.get('using')):
+            # Release what the counters hold for the stored row, not for this possibly stale copy
+            self._counted_state = product_counted_state(self) or (None, False)
+            return super().delete(*args, **kwargs)
+
+
+class ProductListing(models.Model):
+    """Flattened, join-free copy of an active product for the listing pages"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='listing')
+    name = models.CharField(max_length=200)
+    slug = models.SlugField(unique=True)
+    price = models.DecimalField(max_digits=8, decimal_places=2)
+    size = models.CharField(max_length=10)
+    size_label = models.CharField(max_length=50)
+    framed = models.BooleanField(default=False)
+    frame_label = models.CharField(max_length=20)
+    category_name = models.CharField(max_length=100, blank=True)
+    category_slug = models.SlugField(blank=True)
+    image_url = models.CharField(max_length=255, blank=True)
+    image_hash = models.CharField(max_length=64, blank=True)
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    featured = models.BooleanField(default=False)
+    rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-product'], name='listing_created_idx'),
+            models.Index(fields=['featured', '-created_at'], name='listing_featured_idx'),
+            models.Index(fields=['category_slug', '-created_at', '-product'], name='listing_category_idx'),
+            models.Index(fields=['name', 'product'], name='listing_name_idx'),
+            models.Index(fields=['price', 'product'], name='listing_price_idx'),
+            models.Index(fields=['category_slug', 'name', 'product'], name='listing_category_name_idx'),
+            models.Index(fields=['category_slug', 'price', 'product'], name='listing_category_price_idx'),
+            models.Index(fields=['-rating', '-rating_count', '-product'], name='listing_rating_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class ProductRecommendation(models.Model):
+    """Precomputed "customers also bought" neighbours, rebuilt by build_recommendations"""
+    SOURCE_CHOICES = [
+        ('copurchase', 'Bought together'),
+        ('category', 'Same category'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_in')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField(default=0)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='recommendation_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} (#{self.rank})"
 
 
 class CustomDesign(models.Model):
@@ -99,7 +214,7 @@ class CustomDesign(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     framed = models.BooleanField(default=False)
     size = models.CharField(max_length=10, choices=SIZE_CHOICES, default='A4')
-    design_file = models.FileField(upload_to='custom_designs/')
+    design_file = BlobFileField(upload_to='custom_designs/', storage=design_storage)
     phone_number = models.CharField(max_length=20)
     notes = models.TextField(blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -111,6 +226,14 @@ class CustomDesign(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.get_size_display()} - {'Framed' if self.framed else 'Frameless'}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if 'design_file' in loaded:
+            instance._loaded_design_file = loaded['design_file']
+        return instance
     
     def add_to_cart(self):
         from cart.models import CartItem
@@ -137,6 +260,47 @@ class CustomDesign(models.Model):
         return price
 
 
+class StoredBlob(models.Model):
+    """A file in the content-addressed store and how many rows point at it"""
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['ref_count', 'updated_at'], name='blob_gc_idx')]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class DesignUpload(models.Model):
+    """A resumable, chunked upload of a custom design file"""
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('completed', 'Completed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='design_uploads')
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    received_size = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    custom_design = models.OneToOneField(CustomDesign, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_size}/{self.total_size})"
+
+
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -152,6 +316,20 @@ class Review(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.product.name} - {self.rating} stars"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if {'product_id', 'rating', 'is_approved'} <= loaded.keys():
+            # What the product's rating totals currently account for this review
+            instance._rated_state = (loaded['product_id'], loaded['rating'], loaded['is_approved'])
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Keep the row and the product's rating totals in one transaction
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -169,23 +347,30 @@ class Order(models.Model):
     shipping_address = models.TextField()
     phone_number = models.CharField(max_length=20)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    checkout_token = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Order history: one user's orders, newest first, paged by keyset
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_history_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.order_number} - {self.user.username}"
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            self.order_number = f"RHINO{self.id:06d}"
+            from .sequences import next_order_number
+            self.order_number = next_order_number()
         super().save(*args, **kwargs)
 
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='order_items')
     product_name = models.CharField(max_length=200)
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=8, decimal_places=2)
@@ -240,10 +425,74 @@ class PromoCode(models.Model):
         
         return discount
     
-    def use_code(self):
-        if self.is_valid():
+    def redeem(self):
+        """Claim one use with a single conditional UPDATE; False if the code is used up or expired"""
+        from django.utils import timezone
+        now = timezone.now()
+        claimed = PromoCode.objects.filter(
+            models.Q(max_uses=0) | models.Q(used_count__lt=models.F('max_uses')),
+            pk=self.pk,
+            is_active=True,
+            valid_from__lte=now,
+            valid_until__gte=now,
+        ).update(used_count=models.F('used_count') + 1)
+        if claimed:
             self.used_count += 1
-            self.save()
-            return True
-        return False
+        return bool(claimed)
+    
+    def use_code(self):
+        return self.redeem()
+
+
+class Sequence(models.Model):
+    """Named counter handed out in blocks by shop.sequences"""
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name} @ {self.next_value}"
+
+
+class Task(models.Model):
+    """A unit of deferred work, picked up by `manage.py runworker`"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100, db_index=True)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    unique_key = models.CharField(max_length=150, null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed by the running worker; a task that stops getting it is requeued
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'priority', 'run_at'], name='task_claim_idx'),
+        ]
+        constraints = [
+            # At most one pending copy of a deduplicated task
+            models.UniqueConstraint(fields=['unique_key'], condition=models.Q(status='queued'), name='task_unique_queued'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
 
@@ -0,0 +1,110 @@
+import os
+import time
+from collections import namedtuple
+
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .storage import BLOB_DIR, file_sha256
+
+PRINT_DPI = 300
+BLEED_MM = 3
+FRAME_SAFE_MM = 10
+# Trim size in millimetres, portrait
+PAPER_SIZES_MM = {
+    'A5': (148, 210),
+    'A4': (210, 297),
+    'A3': (297, 420),
+}
+PRINT_FORMATS = {
+    'pdf': ('PDF', {}),
+    'tiff': ('TIFF', {'compression': 'tiff_lzw'}),
+}
+
+PrintSettings = namedtuple('PrintSettings', 'fmt dpi bleed_mm safe_mm', defaults=('pdf', PRINT_DPI, BLEED_MM, FRAME_SAFE_MM))
+PrintResult = namedtuple('PrintResult', 'cached pixels seconds')
+
+
+class PrintError(Exception):
+    pass
+
+
+def mm_to_px(mm, dpi=PRINT_DPI):
+    return round(mm / 25.4 * dpi)
+
+
+def canvas_size(size, settings, landscape=False):
+    """Pixel size of the print file: the trim size plus bleed on every side"""
+    width, height = (mm_to_px(mm, settings.dpi) for mm in PAPER_SIZES_MM[size])
+    bleed = mm_to_px(settings.bleed_mm, settings.dpi)
+    if landscape:
+        width, height = height, width
+    return width + 2 * bleed, height + 2 * bleed
+
+
+def design_hash(field_file):
+    """The design's content hash, free when the file lives in the blob store"""
+    name = field_file.name
+    if name.startswith(f'{BLOB_DIR}/'):
+        return os.path.splitext(os.path.basename(name))[0]
+    return file_sha256(field_file.path)
+
+
+def print_file_name(content_hash, size, framed, settings):
+    variant = f"{size}-{'framed' if framed else 'frameless'}-{settings.dpi}dpi-b{settings.bleed_mm:g}"
+    if framed:
+        variant += f'-s{settings.safe_mm:g}'
+    return f'print_files/{content_hash[:2]}/{content_hash}/{variant}.{settings.fmt}'
+
+
+def render_print_file(source_path, output_path, size, framed, settings):
+    """Render one design to a print-ready file; runs in a worker process, so no database access"""
+    if output_path is None:
+        raise PrintError('Print files need local storage')
+    with open(source_path, 'rb') as fh:
+        if fh.read(5) == b'%PDF-':
+            raise PrintError('PDF designs have to be prepared by hand')
+
+    with Image.open(source_path) as original:
+        artwork = ImageOps.exif_transpose(original)
+        artwork = artwork.convert('RGB')
+    # Print in the orientation of the artwork
+    landscape = artwork.width > artwork.height
+    width, height = canvas_size(size, settings, landscape)
+
+    if framed:
+        # The frame's lip covers the bleed plus the safe margin, so keep the artwork inside it
+        inset = mm_to_px(settings.bleed_mm + settings.safe_mm, settings.dpi)
+        box = (width - 2 * inset, height - 2 * inset)
+        fitted = ImageOps.contain(artwork, box, Image.Resampling.LANCZOS)
+        canvas = Image.new('RGB', (width, height), 'white')
+        canvas.paste(fitted, ((width - fitted.width) // 2, (height - fitted.height) // 2))
+    else:
+        # Frameless prints are trimmed, so the artwork runs out into the bleed
+        canvas = ImageOps.fit(artwork, (width, height), Image.Resampling.LANCZOS)
+
+    fmt, options = PRINT_FORMATS[settings.fmt]
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    temp_path = f'{output_path}.{os.getpid()}.tmp'
+    if fmt == 'PDF':
+        canvas.save(temp_path, fmt, resolution=settings.dpi, **options)
+    else:
+        canvas.save(temp_path, fmt, dpi=(settings.dpi, settings.dpi), **options)
+    os.replace(temp_path, output_path)
+    return width * height
+
+
+def prepare_job(source_path, output_path, size, framed, settings, force=False):
+    """Process-pool entry point: reuse the cached file or render a new one"""
+    started = time.perf_counter()
+    if not force and output_path and os.path.exists(output_path):
+        return PrintResult(True, 0, 0.0)
+    pixels = render_print_file(source_path, output_path, size, framed, settings)
+    return PrintResult(False, pixels, time.perf_counter() - started)
+
+
+def output_path(name):
+    try:
+        return default_storage.path(name)
+    except NotImplementedError:
+        return None
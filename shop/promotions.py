@@ -0,0 +1,47 @@
+import threading
+import time
+
+from .models import PromoCode
+
+# Seconds a looked-up code is served from memory; redemption itself always hits the database
+PROMO_CACHE_TTL = 30
+# Most codes held at once; expired ones go first, then the oldest
+PROMO_CACHE_SIZE = 256
+
+_cache = {}
+_lock = threading.Lock()
+
+
+class PromoCodeUnavailable(Exception):
+    """The cart's promo code ran out or expired before the order was placed"""
+
+
+def lookup_promo_code(code):
+    """Return the PromoCode for ``code`` (or None), from a short-lived per-process cache.
+
+    Validity is time dependent, so callers still check ``is_valid()`` on the result.
+    Unknown codes are not cached: they would pile up with every guess, and a
+    code created a moment later must work at once.
+    """
+    code = code.strip().upper()
+    now = time.monotonic()
+    entry = _cache.get(code)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    promo = PromoCode.objects.filter(code=code).first()
+    if promo is None:
+        return None
+    with _lock:
+        _cache.pop(code, None)
+        if len(_cache) >= PROMO_CACHE_SIZE:
+            for key in [key for key, (expires, _) in _cache.items() if expires <= now]:
+                del _cache[key]
+        while len(_cache) >= PROMO_CACHE_SIZE:
+            del _cache[next(iter(_cache))]
+        _cache[code] = (now + PROMO_CACHE_TTL, promo)
+    return promo
+
+
+def forget_promo_code(code):
+    with _lock:
+        _cache.pop(code.upper(), None)
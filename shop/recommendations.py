@@ -0,0 +1,112 @@
+"""Batch computation of "customers also bought" recommendations.
+
+Imported by the build_recommendations command and task only, so the web
+processes do not load NumPy and SciPy.
+"""
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+
+from .caching import bump_version
+from .models import OrderItem, Product, ProductRecommendation
+
+TOP_K = 8
+
+
+def copurchase_matrix():
+    """Return (product ids, products x products co-purchase counts, orders per product).
+
+    Each order counts once per product pair, however many of each were bought.
+    """
+    pairs = (
+        OrderItem.objects.filter(product__isnull=False)
+        .order_by().values_list('order_id', 'product_id').distinct()
+    )
+    order_index = {}
+    product_index = {}
+    rows, cols = [], []
+    for order_id, product_id in pairs.iterator(chunk_size=5000):
+        rows.append(order_index.setdefault(order_id, len(order_index)))
+        cols.append(product_index.setdefault(product_id, len(product_index)))
+
+    product_ids = np.fromiter(product_index, dtype=np.int64, count=len(product_index))
+    if not rows:
+        return product_ids, sparse.csr_matrix((0, 0), dtype=np.float32), np.zeros(0)
+    baskets = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(len(order_index), len(product_index)),
+    )
+    co = (baskets.T @ baskets).tocsr()
+    orders_per_product = co.diagonal()
+    co.setdiag(0)
+    co.eliminate_zeros()
+    return product_ids, co, orders_per_product
+
+
+def top_neighbours(product_ids, co, orders_per_product, active_ids, top_k=TOP_K, min_count=1):
+    """Map product id -> [(neighbour id, score)], best first, scored by cosine similarity"""
+    active = np.isin(product_ids, np.fromiter(active_ids, dtype=np.int64, count=len(active_ids)))
+    norms = np.sqrt(orders_per_product)
+    neighbours = {}
+    for row in range(co.shape[0]):
+        start, end = co.indptr[row], co.indptr[row + 1]
+        cols, counts = co.indices[start:end], co.data[start:end]
+        keep = (counts >= min_count) & active[cols]
+        cols, counts = cols[keep], counts[keep]
+        if not len(cols):
+            continue
+        scores = counts / (norms[row] * norms[cols])
+        if len(cols) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            cols, scores = cols[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        neighbours[int(product_ids[row])] = [(int(product_ids[cols[i]]), float(scores[i])) for i in order]
+    return neighbours
+
+
+def category_peers(products, top_k=TOP_K):
+    """Best-selling active products of each category, for products without enough co-purchases"""
+    peers = {}
+    for product in sorted(products, key=lambda p: (-p.sales_count, -p.rating, -p.pk)):
+        if product.category_id:
+            peers.setdefault(product.category_id, [])
+            if len(peers[product.category_id]) <= top_k:
+                peers[product.category_id].append(product.pk)
+    return peers
+
+
+def build_recommendations(top_k=TOP_K, min_count=1, batch_size=1000):
+    """Recompute the whole ProductRecommendation table; returns (products, co-purchase rows, fallback rows)"""
+    products = list(Product.objects.filter(is_active=True).only('pk', 'category', 'sales_count', 'rating'))
+    active_ids = {product.pk for product in products}
+    product_ids, co, orders_per_product = copurchase_matrix()
+    neighbours = top_neighbours(product_ids, co, orders_per_product, active_ids, top_k, min_count)
+    peers = category_peers(products, top_k)
+
+    rows = []
+    copurchase = fallback = 0
+    for product in products:
+        chosen = neighbours.get(product.pk, [])
+        seen = {product.pk} | {pk for pk, _ in chosen}
+        recommendations = [(pk, score, 'copurchase') for pk, score in chosen]
+        for pk in peers.get(product.category_id, []):
+            if len(recommendations) >= top_k:
+                break
+            if pk not in seen:
+                recommendations.append((pk, 0.0, 'category'))
+                seen.add(pk)
+        for rank, (pk, score, source) in enumerate(recommendations):
+            rows.append(ProductRecommendation(
+                product_id=product.pk, recommended_id=pk, rank=rank, score=score, source=source,
+            ))
+            if source == 'copurchase':
+                copurchase += 1
+            else:
+                fallback += 1
+
+    with transaction.atomic():
+        ProductRecommendation.objects.all().delete()
+        ProductRecommendation.objects.bulk_create(rows, batch_size=batch_size)
+    # Product pages show the recommendations
+    bump_version('catalog')
+    return len(products), copurchase, fallback
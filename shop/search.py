@@ -0,0 +1,139 @@
+import re
+
+from django.db import connection
+from django.db.models import Case, When, Q
+
+from .models import Product
+
+INDEX_TABLE = 'shop_search_index'
+MAX_RESULTS = 500
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def backend_supported(vendor=None):
+    return (vendor or connection.vendor) in ('sqlite', 'postgresql')
+
+
+def _document(product):
+    category = product.category
+    return (product.name, category.name if category else '', product.description or '')
+
+
+def _write(cursor, rows):
+    """Upsert (product_id, name, category, description) rows into the index"""
+    if connection.vendor == 'sqlite':
+        cursor.executemany(f"DELETE FROM {INDEX_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(
+            f"INSERT INTO {INDEX_TABLE} (rowid, name, category, description) VALUES (%s, %s, %s, %s)",
+            rows,
+        )
+    else:
+        cursor.executemany(
+            f"INSERT INTO {INDEX_TABLE} (product_id, document) VALUES (%s, "
+            "setweight(to_tsvector('simple', %s), 'A') || "
+            "setweight(to_tsvector('simple', %s), 'B') || "
+            "setweight(to_tsvector('simple', %s), 'C')) "
+            "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+            rows,
+        )
+
+
+def index_products(products):
+    """Add or refresh the index entries of the given products"""
+    if not backend_supported():
+        return
+    active = [(p.pk,) + _document(p) for p in products if p.is_active]
+    inactive = [p.pk for p in products if not p.is_active]
+    with connection.cursor() as cursor:
+        if active:
+            _write(cursor, active)
+    if inactive:
+        remove_products(inactive)
+
+
+def index_product(product):
+    index_products([product])
+
+
+def remove_products(product_ids):
+    if not backend_supported() or not product_ids:
+        return
+    key = 'rowid' if connection.vendor == 'sqlite' else 'product_id'
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {INDEX_TABLE} WHERE {key} = %s", [(pk,) for pk in product_ids])
+
+
+def index_category(category_or_ids):
+    """Re-index products after their category was renamed or removed"""
+    if isinstance(category_or_ids, (list, tuple, set)):
+        products = Product.objects.filter(id__in=category_or_ids)
+    else:
+        products = Product.objects.filter(category=category_or_ids)
+    index_products(list(products.select_related('category')))
+
+
+def rebuild_index(batch_size=1000):
+    """Drop every entry and re-index all active products"""
+    if not backend_supported():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {INDEX_TABLE}")
+        products = Product.objects.filter(is_active=True).select_related('category')
+        batch = []
+        count = 0
+        for product in products.iterator(chunk_size=batch_size):
+            batch.append((product.pk,) + _document(product))
+            if len(batch) >= batch_size:
+                _write(cursor, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            _write(cursor, batch)
+            count += len(batch)
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"INSERT INTO {INDEX_TABLE} ({INDEX_TABLE}) VALUES ('optimize')")
+    return count
+
+
+def search_product_ids(query, limit=MAX_RESULTS):
+    """Return product ids matching every term of the query (as prefixes), best match first.
+
+    Returns None when the database has no full-text support.
+    """
+    if not backend_supported():
+        return None
+    terms = TOKEN_RE.findall(query.lower())
+    if not terms:
+        return []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            match = ' '.join(f'"{term}"*' for term in terms)
+            cursor.execute(
+                f"SELECT rowid FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s "
+                f"ORDER BY bm25({INDEX_TABLE}, 10.0, 5.0, 1.0) LIMIT %s",
+                [match, limit],
+            )
+        else:
+            match = ' & '.join(f'{term}:*' for term in terms)
+            cursor.execute(
+                f"SELECT product_id FROM {INDEX_TABLE} WHERE document @@ to_tsquery('simple', %s) "
+                "ORDER BY ts_rank(document, to_tsquery('simple', %s)) DESC LIMIT %s",
+                [match, match, limit],
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_listings(queryset, query):
+    """Filter a ProductListing queryset down to the search hits, ordered by rank"""
+    ids = search_product_ids(query)
+    if ids is None:
+        return queryset.filter(
+            Q(name__icontains=query) |
+            Q(product__description__icontains=query) |
+            Q(category_name__icontains=query)
+        )
+    if not ids:
+        return queryset.none()
+    rank = Case(*[When(product_id=pk, then=position) for position, pk in enumerate(ids)])
+    return queryset.filter(product_id__in=ids).order_by(rank)
@@ -0,0 +1,61 @@
+import os
+import threading
+
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import F
+
+from .models import Sequence
+
+
+def reserve_block(name, size, using=DEFAULT_DB_ALIAS):
+    """Atomically claim ``size`` consecutive values and return the half-open range [start, end).
+
+    The UPDATE takes the row lock before the value is read back, so two
+    callers can never receive overlapping ranges.
+    """
+    with transaction.atomic(using=using):
+        sequences = Sequence.objects.using(using).filter(name=name)
+        if not sequences.update(next_value=F('next_value') + size):
+            Sequence.objects.using(using).get_or_create(name=name)
+            sequences.update(next_value=F('next_value') + size)
+        end = sequences.values_list('next_value', flat=True).get()
+    return end - size, end
+
+
+class HiLoAllocator:
+    """Hands out values from a named Sequence, reserving ``block_size`` of them per database write.
+
+    One allocator lives in each worker process. A block reserved inside a
+    transaction could be rolled back after its leftover values were cached,
+    so inside atomic blocks a single value is taken instead and it commits
+    or rolls back together with the row that uses it.
+    """
+
+    def __init__(self, name, block_size=50, using=DEFAULT_DB_ALIAS):
+        self.name = name
+        self.block_size = block_size
+        self.using = using
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._next = self._end = 0
+
+    def allocate(self):
+        if connections[self.using].in_atomic_block:
+            return reserve_block(self.name, 1, self.using)[0]
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: never share the parent's block
+                self._pid = os.getpid()
+                self._next = self._end = 0
+            if self._next >= self._end:
+                self._next, self._end = reserve_block(self.name, self.block_size, self.using)
+            value = self._next
+            self._next += 1
+            return value
+
+
+order_numbers = HiLoAllocator('order_number')
+
+
+def next_order_number():
+    return f"RHINO{order_numbers.allocate():06d}"
@@ -0,0 +1,105 @@
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import Product, Category, PromoCode, CustomDesign, Review
+from . import counters, images, listings, search
+from .caching import bump_version
+from .promotions import forget_promo_code
+
+
+@receiver(pre_save, sender=Category)
+def clear_stale_image_hash(sender, instance, **kwargs):
+    # The derivatives belong to the previous file until the background job catches up
+    if instance.image.name != getattr(instance, '_loaded_image', instance.image.name):
+        instance.image_hash = ''
+        instance.image_width = None
+
+
+@receiver(pre_save, sender=Product)
+def product_saving(sender, instance, **kwargs):
+    clear_stale_image_hash(sender, instance)
+    instance._previous_counted_state = counters.product_counted_state(instance)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    listings.refresh_listing(instance)
+    search.index_product(instance)
+    if counters.sync_category_counts(instance._previous_counted_state, instance):
+        bump_version('categories')
+    if instance.image and not instance.image_hash:
+        images.schedule_derivatives(instance)
+    instance._loaded_image = instance.image.name
+    bump_version('catalog')
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+    if counters.release_category_count(instance):
+        bump_version('categories')
+    bump_version('catalog')
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    listings.refresh_category_listings(instance)
+    search.index_category(instance)
+    if instance.image and not instance.image_hash:
+        images.schedule_derivatives(instance)
+    instance._loaded_image = instance.image.name
+    bump_version('catalog')
+    bump_version('categories')
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    # Products are SET_NULL before post_delete fires, so remember them now
+    instance._product_ids = list(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    listings.clear_category_listings(instance.slug)
+    search.index_category(getattr(instance, '_product_ids', []))
+    bump_version('catalog')
+    bump_version('categories')
+
+
+@receiver(pre_save, sender=Review)
+def review_saving(sender, instance, **kwargs):
+    instance._previous_rated_state = counters.review_rated_state(instance)
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, **kwargs):
+    counters.sync_product_rating(instance._previous_rated_state, instance)
+    # Reviews appear on the cached product pages even when the rating is unchanged
+    bump_version('catalog')
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    counters.release_review_rating(instance)
+    bump_version('catalog')
+
+
+@receiver(post_save, sender=PromoCode)
+@receiver(post_delete, sender=PromoCode)
+def promo_code_changed(sender, instance, **kwargs):
+    forget_promo_code(instance.code)
+
+
+@receiver(post_save, sender=CustomDesign)
+def custom_design_saved(sender, instance, **kwargs):
+    # Saving a new file took a reference on its blob, even when it is the blob the row
+    # already had; now that the row points at it, give back the previous file's reference
+    if getattr(instance, '_unsaved_blobs', {}).pop('design_file', None) is not None:
+        instance.design_file.storage.delete(getattr(instance, '_loaded_design_file', None))
+    instance._loaded_design_file = instance.design_file.name
+
+
+@receiver(post_delete, sender=CustomDesign)
+def custom_design_deleted(sender, instance, **kwargs):
+    if instance.design_file:
+        instance.design_file.storage.delete(instance.design_file.name)
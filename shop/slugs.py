@@ -0,0 +1,32 @@
+from django.utils.text import slugify
+
+# Room left for a "-N" suffix when looking up slugs that share a base
+SUFFIX_ROOM = 6
+
+
+def slug_base(value, max_length, fallback):
+    """slugify() cut to the column length; names without any ASCII letters fall back to e.g. 'product'"""
+    return slugify(value)[:max_length].strip('-') or fallback
+
+
+def next_free_slug(base, taken, max_length):
+    """The first of base, base-2, base-3, ... that is not in `taken`"""
+    slug = base
+    n = 2
+    while slug in taken:
+        suffix = f'-{n}'
+        slug = base[:max_length - len(suffix)].rstrip('-') + suffix
+        n += 1
+    return slug
+
+
+def unique_slug(instance, value):
+    """A slug for `instance` derived from `value` that no other row of its model uses"""
+    model = type(instance)
+    max_length = model._meta.get_field('slug').max_length
+    base = slug_base(value, max_length, model._meta.model_name)
+    taken = set(
+        model._default_manager.filter(slug__startswith=base[:max_length - SUFFIX_ROOM])
+        .exclude(pk=instance.pk).values_list('slug', flat=True)
+    )
+    return next_free_slug(base, taken, max_length)
@@ -0,0 +1,204 @@
+import hashlib
+import os
+import tempfile
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+BLOB_DIR = 'blobs'
+
+
+def blob_name(sha256, ext=''):
+    return f'{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}'
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Store files under their SHA-256 so identical uploads share one blob.
+
+    Every save takes a reference on the blob's StoredBlob row and delete()
+    drops one; the bytes are only removed by the gc_media_blobs command once
+    nothing references them any more.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The real name is only known once the content is hashed in _save()
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()
+        sha256 = getattr(content, 'sha256', None)
+        size = content.size
+        temp_path = None
+        if sha256 is None:
+            temp_path, sha256 = self._spool(content)
+
+        name = blob_name(sha256, ext)
+        self.retain(name, sha256, size)
+        if self.exists(name):
+            if temp_path:
+                os.remove(temp_path)
+            return name
+
+        if temp_path is None:
+            temp_path, _ = self._spool(content)
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(temp_path, self.file_permissions_mode)
+        # Identical bytes, so a concurrent writer of the same blob is harmless
+        os.replace(temp_path, full_path)
+        return name
+
+    def _spool(self, content):
+        """Copy content into a temporary file next to the blobs, hashing it on the way"""
+        directory = self.path(BLOB_DIR)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    fh.write(chunk)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return temp_path, digest.hexdigest()
+
+    def retain(self, name, sha256, size):
+        from .models import StoredBlob
+
+        while True:
+            updated = StoredBlob.objects.filter(name=name).update(
+                ref_count=F('ref_count') + 1, updated_at=timezone.now()
+            )
+            if updated:
+                return
+            try:
+                with transaction.atomic():
+                    StoredBlob.objects.create(name=name, sha256=sha256, size=size, ref_count=1)
+                return
+            except IntegrityError:
+                continue
+
+    def delete(self, name):
+        """Drop one reference; the file itself is left for garbage collection"""
+        from .models import StoredBlob
+
+        if name:
+            StoredBlob.objects.filter(name=name, ref_count__gt=0).update(
+                ref_count=F('ref_count') - 1, updated_at=timezone.now()
+            )
+
+
+design_storage = ContentAddressedStorage()
+
+
+class BlobFieldFile(FieldFile):
+    """Remembers on the instance each file saved but not yet stored on its row.
+
+    Every save takes a reference, even one for the blob the row already
+    points at, so the owner's post_save knows to give back the reference of
+    the file it replaced.
+    """
+
+    def save(self, name, content, save=True):
+        unsaved = self.instance.__dict__.setdefault('_unsaved_blobs', {})
+        # Saved again before the row was: the earlier file never made it there
+        self.storage.delete(unsaved.pop(self.field.attname, None))
+        super().save(name, content, save=False)
+        unsaved[self.field.attname] = self.name
+        if save:
+            self.instance.save()
+
+
+class BlobFileField(models.FileField):
+    """FileField for a ContentAddressedStorage; see BlobFieldFile"""
+    attr_class = BlobFieldFile
+
+
+def content_addressed_fields():
+    """Every (model, field) pair whose files live in a ContentAddressedStorage"""
+    return [
+        (model, field)
+        for model in apps.get_models()
+        for field in model._meta.get_fields()
+        if isinstance(field, models.FileField) and isinstance(field.storage, ContentAddressedStorage)
+    ]
+
+
+def recount_blobs():
+    """Recompute every reference count from the rows that point at the blobs"""
+    from .models import StoredBlob
+
+    counts = {}
+    for model, field in content_addressed_fields():
+        rows = (
+            model._default_manager.exclude(**{field.name: ''})
+            .values(field.name).annotate(count=models.Count('pk')).order_by()
+        )
+        for row in rows:
+            counts[row[field.name]] = counts.get(row[field.name], 0) + row['count']
+
+    with transaction.atomic():
+        blobs = list(StoredBlob.objects.select_for_update())
+        changed = []
+        for blob in blobs:
+            ref_count = counts.get(blob.name, 0)
+            if blob.ref_count != ref_count:
+                blob.ref_count = ref_count
+                changed.append(blob)
+        StoredBlob.objects.bulk_update(changed, ['ref_count'], batch_size=500)
+    return len(changed)
+
+
+def collect_garbage(storage=design_storage, grace=None, dry_run=False):
+    """Delete unreferenced blobs and stray files; returns (files removed, bytes freed)"""
+    from .models import StoredBlob
+
+    cutoff = timezone.now() - grace if grace else timezone.now()
+    removed = freed = 0
+    for blob in list(StoredBlob.objects.filter(ref_count=0, updated_at__lt=cutoff)):
+        if dry_run:
+            removed, freed = removed + 1, freed + blob.size
+            continue
+        with transaction.atomic():
+            # Holding the row lock keeps a concurrent save from reviving it mid-delete
+            locked = StoredBlob.objects.select_for_update().filter(pk=blob.pk, ref_count=0).first()
+            if locked is None:
+                continue
+            if storage.exists(blob.name):
+                os.remove(storage.path(blob.name))
+            locked.delete()
+        removed, freed = removed + 1, freed + blob.size
+
+    # Files whose save was rolled back never got a row
+    known = set(StoredBlob.objects.values_list('name', flat=True))
+    root = storage.path(BLOB_DIR)
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            if name in known:
+                continue
+            if os.path.getmtime(path) >= cutoff.timestamp():
+                continue
+            size = os.path.getsize(path)
+            if not dry_run:
+                os.remove(path)
+            removed, freed = removed + 1, freed + size
+    return removed, freed
@@ -0,0 +1,213 @@
+"""Seeded synthetic shop data at realistic volumes, for benchmarks and load tests.
+
+Everything created is tagged (usernames start with USER_PREFIX, SKUs with
+SKU_PREFIX) so it can be removed again with remove_synthetic_data().
+"""
+import random
+from collections import Counter, namedtuple
+from itertools import accumulate
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from cart.models import CartItem
+from .caching import bump_version
+from .catalog_import import import_catalog
+from .counters import bulk_increment, recount_categories, recount_ratings
+from .models import Order, OrderItem, Product, PromoCode, Review
+from .sequences import next_order_number
+
+USER_PREFIX = 'synthetic-'
+SKU_PREFIX = 'SYN-'
+# Every synthetic user can log in with this password
+PASSWORD = 'synthetic-password'
+PROMO_CODE = 'SYNTH10'
+
+Scale = namedtuple('Scale', 'users categories products reviews orders carts')
+SCALES = {
+    'small': Scale(users=50, categories=6, products=500, reviews=1000, orders=300, carts=20),
+    'medium': Scale(users=1000, categories=12, products=5000, reviews=20000, orders=10000, carts=200),
+    'large': Scale(users=10000, categories=24, products=50000, reviews=200000, orders=100000, carts=2000),
+}
+
+ADJECTIVES = [
+    'Golden', 'Quiet', 'Electric', 'Faded', 'Bold', 'Misty', 'Neon', 'Rustic', 'Silent', 'Vivid',
+    'Ancient', 'Urban', 'Wild', 'Frozen', 'Velvet', 'Crimson', 'Pastel', 'Lunar', 'Desert', 'Ocean',
+]
+NOUNS = [
+    'Sunset', 'Skyline', 'Forest', 'Harbor', 'Nile', 'Pyramid', 'Garden', 'Portrait', 'Horizon', 'Street',
+    'Bloom', 'Mountain', 'Wave', 'Market', 'Lantern', 'Falcon', 'Dune', 'Bridge', 'Orchard', 'Mosaic',
+]
+THEMES = [
+    'Abstract Art', 'Nature', 'Minimalist', 'Vintage', 'Modern', 'Artistic', 'Typography', 'Cities',
+    'Cinema', 'Music', 'Sports', 'Calligraphy', 'Botanical', 'Space', 'Animals', 'Maps',
+    'Architecture', 'Kids', 'Quotes', 'Retro Games', 'Anime', 'Cars', 'Food', 'Travel',
+]
+ORDER_STATUSES = ['delivered'] * 6 + ['shipped', 'processing', 'confirmed', 'pending', 'cancelled']
+
+
+def _popularity(count):
+    """Cumulative Zipf-like weights: a few best-sellers and a long tail, as in real order data"""
+    return list(accumulate(1 / (rank + 1) for rank in range(count)))
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def product_rows(rng, scale):
+    categories = (THEMES * (scale.categories // len(THEMES) + 1))[:scale.categories]
+    for n in range(scale.products):
+        name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}'
+        yield {
+            'sku': f'{SKU_PREFIX}{n:06d}',
+            'name': name,
+            'description': f'{name} printed on heavyweight matte paper. ' * rng.randint(1, 4),
+            'base_price': str(rng.choice([25, 30, 35, 45, 60, 80, 120])),
+            'size': rng.choice(['A5', 'A4', 'A4', 'A3']),
+            'framed': rng.random() < 0.4,
+            'featured': rng.random() < 0.02,
+            'is_active': rng.random() < 0.97,
+            'category': categories[n % len(categories)],
+        }
+
+
+def create_users(scale, batch_size):
+    password = make_password(PASSWORD)
+    users = [
+        User(username=f'{USER_PREFIX}{n:06d}', email=f'{USER_PREFIX}{n:06d}@example.com', password=password)
+        for n in range(scale.users)
+    ]
+    User.objects.bulk_create(users, batch_size=batch_size)
+    return list(User.objects.filter(username__startswith=USER_PREFIX).order_by('pk').values_list('pk', flat=True))
+
+
+def create_reviews(rng, scale, user_ids, products, weights, batch_size):
+    wanted = min(scale.reviews, len(user_ids) * len(products))
+    pairs = set()
+    while len(pairs) < wanted:
+        pairs.add((rng.choices(products, cum_weights=weights)[0].pk, rng.choice(user_ids)))
+    reviews = [
+        Review(
+            product_id=product_id, user_id=user_id,
+            rating=rng.choices([5, 4, 3, 2, 1], [45, 30, 13, 7, 5])[0],
+            comment=rng.choice(['Great print quality.', 'Looks perfect on my wall.', 'Colours a bit off.',
+                                'Fast delivery, nice frame.', 'Exactly like the photo.']),
+            is_approved=rng.random() < 0.9,
+        )
+        for product_id, user_id in pairs
+    ]
+    Review.objects.bulk_create(reviews, batch_size=batch_size)
+    recount_ratings()
+    return len(reviews)
+
+
+def create_orders(rng, scale, user_ids, products, weights, batch_size):
+    now = timezone.now()
+    sales = Counter()
+    created = 0
+    for chunk in _batches(range(scale.orders), batch_size):
+        orders, lines = [], []
+        for _ in chunk:
+            picked = rng.choices(products, cum_weights=weights, k=rng.choices([1, 2, 3, 4], [50, 30, 15, 5])[0])
+            items = [
+                (product, rng.choices([1, 2, 3], [80, 15, 5])[0])
+                for product in {product.pk: product for product in picked}.values()
+            ]
+            order = Order(
+                user_id=rng.choice(user_ids),
+                order_number=next_order_number(),
+                total_amount=sum(product.final_price * quantity for product, quantity in items),
+                shipping_address=f'{rng.randint(1, 200)} {rng.choice(NOUNS)} St, Cairo',
+                phone_number=f'01{rng.randint(0, 2)}{rng.randint(10000000, 99999999)}',
+                status=rng.choice(ORDER_STATUSES),
+            )
+            orders.append(order)
+            lines.append(items)
+        Order.objects.bulk_create(orders)
+        # created_at is auto_now_add, so spread the orders over the past year afterwards
+        for order in orders:
+            order.created_at = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+        Order.objects.bulk_update(orders, ['created_at'])
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order, product=product, product_name=product.name,
+                quantity=quantity, price=product.final_price,
+            )
+            for order, items in zip(orders, lines)
+            for product, quantity in items
+        ])
+        for order, items in zip(orders, lines):
+            if order.status != 'cancelled':
+                for product, quantity in items:
+                    sales[product.pk] += quantity
+        created += len(orders)
+    # One UPDATE ... CASE per slice keeps the statement within the backend's parameter limit
+    keys = list(sales)
+    for chunk in _batches(keys, 500):
+        bulk_increment(Product, 'sales_count', {pk: sales[pk] for pk in chunk})
+    return created
+
+
+def create_carts(rng, scale, user_ids, products, weights, batch_size):
+    items = []
+    for user_id in rng.sample(user_ids, min(scale.carts, len(user_ids))):
+        picked = rng.choices(products, cum_weights=weights, k=rng.randint(1, 5))
+        for product in {product.pk: product for product in picked}.values():
+            items.append(CartItem(
+                user_id=user_id, product=product, product_name=product.name,
+                price=product.base_price, quantity=rng.randint(1, 3),
+            ))
+    CartItem.objects.bulk_create(items, batch_size=batch_size)
+    return len(items)
+
+
+def generate(scale, seed=0, batch_size=1000):
+    """Create a full synthetic shop; the same seed always produces the same data"""
+    rng = random.Random(seed)
+    counts = {}
+    user_ids = create_users(scale, batch_size)
+    counts['users'] = len(user_ids)
+
+    stats, _ = import_catalog(product_rows(rng, scale), batch_size=batch_size)
+    counts['products'] = stats['created'] + stats['updated'] + stats['unchanged']
+    counts['new_categories'] = stats['categories']
+
+    products = list(Product.objects.filter(sku__startswith=SKU_PREFIX, is_active=True).order_by('sku'))
+    rng.shuffle(products)
+    weights = _popularity(len(products))
+    counts['reviews'] = create_reviews(rng, scale, user_ids, products, weights, batch_size)
+    counts['orders'] = create_orders(rng, scale, user_ids, products, weights, batch_size)
+    counts['cart_items'] = create_carts(rng, scale, user_ids, products, weights, batch_size)
+
+    PromoCode.objects.get_or_create(code=PROMO_CODE, defaults={
+        'description': '10% off (synthetic data)',
+        'discount_type': 'percentage',
+        'discount_value': Decimal('10'),
+        'valid_from': timezone.now() - timedelta(days=1),
+        'valid_until': timezone.now() + timedelta(days=365),
+    })
+    bump_version('catalog')
+    return counts
+
+
+def has_synthetic_data():
+    return User.objects.filter(username__startswith=USER_PREFIX).exists()
+
+
+def remove_synthetic_data():
+    """Delete every synthetic user (with their orders, reviews and carts) and product"""
+    users = User.objects.filter(username__startswith=USER_PREFIX)
+    Order.objects.filter(user__in=users).delete()
+    Review.objects.filter(user__in=users).delete()
+    deleted = users.delete()[0]
+    deleted += Product.objects.filter(sku__startswith=SKU_PREFIX).delete()[0]
+    PromoCode.objects.filter(code=PROMO_CODE).delete()
+    recount_categories()
+    bump_version('catalog')
+    bump_version('categories')
+    return deleted
@@ -0,0 +1,231 @@
+"""A small task queue stored in the application database.
+
+Tasks are enqueued with a plain INSERT, so a task queued inside a
+transaction only becomes visible to workers once that transaction commits
+and disappears with it on rollback. `manage.py runworker` claims due tasks
+and runs them in a thread or process pool.
+
+Tasks run at least once: a worker that dies after doing a task's work but
+before recording it leaves the task to be run again, so every task must be
+safe to repeat.
+"""
+import logging
+import random
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Avg, Count, Exists, F, Min, OuterRef
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+
+def is_eager():
+    """Run tasks in-process after commit instead of queueing them (TASK_QUEUE_EAGER, for development)"""
+    return getattr(settings, 'TASK_QUEUE_EAGER', False)
+
+
+class TaskSpec:
+    def __init__(self, func, name, max_attempts, retry_delay, priority):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.priority = priority
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        return self.enqueue(args=args, kwargs=kwargs)
+
+    def enqueue(self, args=(), kwargs=None, run_at=None, unique_key=None):
+        return enqueue(self.name, args, kwargs, run_at=run_at, unique_key=unique_key)
+
+
+_registry = {}
+# name -> (interval, spec); queued by the worker whenever the interval has passed
+_periodic = {}
+
+
+def task(name=None, max_attempts=3, retry_delay=30, priority=0):
+    """Register a function as a task; call `.delay(...)` to queue it"""
+    def decorator(func):
+        spec = TaskSpec(func, name or f'{func.__module__}.{func.__name__}', max_attempts, retry_delay, priority)
+        _registry[spec.name] = spec
+        return spec
+    return decorator
+
+
+def periodic_task(interval, **options):
+    """Register a task that the worker queues every `interval` (a timedelta)"""
+    def decorator(func):
+        spec = task(**options)(func)
+        _periodic[spec.name] = (interval, spec)
+        return spec
+    return decorator
+
+
+def get_task(name):
+    return _registry[name]
+
+
+def enqueue(name, args=(), kwargs=None, run_at=None, unique_key=None):
+    """Queue a registered task; returns the Task row (or the pending duplicate)"""
+    spec = _registry[name]
+    if is_eager() and run_at is None:
+        transaction.on_commit(lambda: spec(*args, **(kwargs or {})))
+        return None
+    values = dict(
+        name=name,
+        args=list(args),
+        kwargs=kwargs or {},
+        priority=spec.priority,
+        max_attempts=spec.max_attempts,
+        run_at=run_at or timezone.now(),
+        unique_key=unique_key,
+    )
+    if unique_key is None:
+        return Task.objects.create(**values)
+    try:
+        with transaction.atomic():
+            return Task.objects.create(**values)
+    except IntegrityError:
+        return Task.objects.filter(unique_key=unique_key, status=Task.QUEUED).first()
+
+
+def claim_tasks(worker, limit):
+    """Mark up to `limit` due tasks as running for this worker and return them"""
+    now = timezone.now()
+    due = Task.objects.filter(status=Task.QUEUED, run_at__lte=now).order_by('-priority', 'run_at')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        # The status condition keeps two workers from claiming the same row on backends without row locks
+        Task.objects.filter(pk__in=ids, status=Task.QUEUED).update(
+            status=Task.RUNNING, locked_by=worker, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1,
+        )
+    return list(Task.objects.filter(pk__in=ids, status=Task.RUNNING, locked_by=worker, started_at=now))
+
+
+SUPERSEDED = 'Superseded by an identical task that was already queued'
+
+
+def requeue(tasks, **values):
+    """Set tasks back to queued, with `values` applied; returns how many were queued.
+
+    Only one queued task may hold a unique_key (task_unique_queued), so a task
+    is skipped when another task with its key is already queued, or when an
+    earlier task in `tasks` shares its key; that other task does the same work.
+    """
+    queued_twin = Task.objects.filter(unique_key=OuterRef('unique_key'), status=Task.QUEUED).exclude(pk=OuterRef('pk'))
+    earlier_sibling = Task.objects.filter(
+        pk__in=tasks.values('pk'), unique_key=OuterRef('unique_key'), pk__lt=OuterRef('pk'),
+    )
+    while True:
+        try:
+            with transaction.atomic():
+                return tasks.filter(~Exists(queued_twin), ~Exists(earlier_sibling)).update(status=Task.QUEUED, **values)
+        except IntegrityError:
+            # A twin was queued concurrently; the next pass skips it
+            continue
+
+
+def retry_delay(spec, attempts):
+    """Exponential backoff with jitter"""
+    delay = spec.retry_delay * 2 ** (attempts - 1)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def execute_task(task_id):
+    """Run one claimed task and record the outcome; safe to call from a pool"""
+    close_old_connections()
+    try:
+        task = Task.objects.get(pk=task_id)
+        spec = _registry.get(task.name)
+        try:
+            if spec is None:
+                raise LookupError(f'Unknown task {task.name!r}')
+            spec(*task.args, **task.kwargs)
+        except Exception:
+            error = traceback.format_exc()
+            logger.exception("Task %s (%s) failed", task.pk, task.name)
+            if spec is not None and task.attempts < task.max_attempts:
+                retried = requeue(
+                    Task.objects.filter(pk=task.pk), locked_by='', last_error=error,
+                    run_at=timezone.now() + retry_delay(spec, task.attempts),
+                )
+                if retried:
+                    return Task.QUEUED
+                error = f'{error}\n{SUPERSEDED}'
+            Task.objects.filter(pk=task.pk).update(status=Task.FAILED, last_error=error, finished_at=timezone.now())
+            return Task.FAILED
+        Task.objects.filter(pk=task.pk).update(status=Task.DONE, finished_at=timezone.now())
+        return Task.DONE
+    finally:
+        connection.close()
+
+
+def queue_periodic_tasks(last_queued):
+    """Queue every periodic task whose interval has passed; `last_queued` is the worker's bookkeeping"""
+    now = time.monotonic()
+    for name, (interval, spec) in _periodic.items():
+        if now - last_queued.get(name, float('-inf')) >= interval.total_seconds():
+            spec.enqueue(unique_key=f'periodic:{name}')
+            last_queued[name] = now
+
+
+def heartbeat(worker):
+    """Mark the tasks this worker is still running as alive"""
+    return Task.objects.filter(status=Task.RUNNING, locked_by=worker).update(heartbeat_at=timezone.now())
+
+
+def requeue_stale(timeout):
+    """Give back to the queue the tasks whose worker sent no heartbeat for `timeout`.
+
+    A slow task keeps its worker's heartbeat going, so only tasks of a worker
+    that died are requeued, however long they take.
+    """
+    stale = Task.objects.filter(status=Task.RUNNING, heartbeat_at__lt=timezone.now() - timeout)
+    queued = requeue(stale, locked_by='')
+    # What is still running is superseded by a queued twin
+    stale.update(status=Task.FAILED, locked_by='', last_error=SUPERSEDED, finished_at=timezone.now())
+    return queued
+
+
+def prune_finished(older_than):
+    return Task.objects.filter(status=Task.DONE, finished_at__lt=timezone.now() - older_than).delete()[0]
+
+
+def queue_stats():
+    """Counts per task and status, average run time and queue lag, from two grouped queries"""
+    rows = Task.objects.order_by().values('name', 'status').annotate(
+        count=Count('pk'), avg_duration=Avg(F('finished_at') - F('started_at')),
+    )
+    tasks = {}
+    totals = {status: 0 for status, _ in Task.STATUS_CHOICES}
+    for row in rows:
+        entry = tasks.setdefault(row['name'], {'name': row['name'], **{status: 0 for status in totals}})
+        entry[row['status']] = row['count']
+        totals[row['status']] += row['count']
+        if row['status'] == Task.DONE and row['avg_duration'] is not None:
+            entry['avg_seconds'] = round(row['avg_duration'].total_seconds(), 3)
+
+    oldest = Task.objects.filter(status=Task.QUEUED, run_at__lte=timezone.now()).aggregate(oldest=Min('run_at'))['oldest']
+    return {
+        'totals': totals,
+        'tasks': sorted(tasks.values(), key=lambda entry: entry['name']),
+        'lag_seconds': round((timezone.now() - oldest).total_seconds(), 3) if oldest else 0,
+        'recent_failures': list(
+            Task.objects.filter(status=Task.FAILED).order_by('-finished_at')
+            .values('id', 'name', 'attempts', 'finished_at', 'last_error')[:10]
+        ),
+    }
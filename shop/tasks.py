@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+
+from .images import process_image
+from .models import Order
+from .taskqueue import periodic_task, task
+
+
+@task(name='shop.build_image_derivatives', retry_delay=60)
+def build_image_derivatives(model_label, pk, force=False):
+    process_image(apps.get_model(model_label), pk, force=force)
+
+
+@task(name='shop.send_order_confirmation', max_attempts=5, retry_delay=120)
+def send_order_confirmation(order_id):
+    order = Order.objects.select_related('user').filter(pk=order_id).first()
+    if order is None or not order.user.email:
+        return
+    send_mail(
+        f"Your RHINO.EG order #{order.order_number}",
+        render_to_string('shop/emails/order_confirmation.txt', {'order': order, 'items': order.items.all()}),
+        None,
+        [order.user.email],
+    )
+
+
+@periodic_task(timedelta(hours=6), name='shop.build_recommendations', max_attempts=1)
+def build_recommendations():
+    # Imported here so web processes that queue other tasks never load NumPy
+    from .recommendations import build_recommendations
+
+    build_recommendations()
+
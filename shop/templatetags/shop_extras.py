@@ -1,4 +1,7 @@
 from django import template
+from django.utils.html import format_html
+
+from shop.images import DERIVATIVE_FORMATS, DERIVATIVE_SIZES, derivative_url
 
 register = template.Library()
 
@@ -9,3 +12,40 @@ def multiply(value, arg):
         return float(value) * float(arg)
     except (ValueError, TypeError):
         return 0
+
+
+def srcset_widths(width):
+    """(size name, real width) of the distinct derivatives of an image `width` pixels wide"""
+    candidates = []
+    for name, target in DERIVATIVE_SIZES.items():
+        # Derivatives are never upscaled: the first size at or above the original is a
+        # full-size copy and the larger ones are the same picture again
+        candidates.append((name, min(target, width)))
+        if target >= width:
+            break
+    return candidates
+
+
+@register.simple_tag
+def responsive_image(url, image_hash, size='card', width=None, alt='', css_class='', style='', sizes='100vw'):
+    """<picture> with WebP and JPEG srcsets, or a plain <img> until derivatives exist.
+
+    `width` is the original's width; the srcset needs it to advertise real widths.
+    """
+    if not image_hash or not width:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" style="{}" loading="lazy">', url, alt, css_class, style,
+        )
+    srcsets = {
+        ext: ', '.join(
+            f'{derivative_url(image_hash, name, ext)} {real_width}w'
+            for name, real_width in srcset_widths(width)
+        )
+        for ext in DERIVATIVE_FORMATS
+    }
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" style="{}" loading="lazy"></picture>',
+        srcsets['webp'], sizes,
+        derivative_url(image_hash, size, 'jpg'), srcsets['jpg'], sizes, alt, css_class, style,
+    )
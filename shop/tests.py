@@ -1,3 +1,1054 @@
-from django.test import TestCase
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.http import QueryDict
+from django.core.files.base import ContentFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from cart.models import Cart, CartItem
+
+from . import promotions
+from .benchmark import run_benchmark
+from .caching import VERSION_CHECK_INTERVAL, get_active_categories, versioned_key
+from .catalog_import import import_catalog
+from .counters import CounterBuffer, product_views, recount_categories, recount_ratings
+from .listings import SORT_ORDERINGS, apply_filters, facet_counts, parse_filters
+from .metrics import registry
+from .models import (
+    Category, CustomDesign, DesignUpload, Order, OrderItem, Product, ProductListing, ProductRecommendation,
+    PromoCode, Review, Sequence, StoredBlob, Task,
+)
+from .pagination import KeysetPaginator
+from .printing import BLEED_MM, FRAME_SAFE_MM, PrintSettings, canvas_size, mm_to_px, prepare_job, print_file_name
+from .promotions import lookup_promo_code
+from .recommendations import build_recommendations
+from .search import search_listings, search_product_ids
+from .sequences import HiLoAllocator, reserve_block
+from .storage import collect_garbage, design_storage
+from .synthetic import Scale, generate, remove_synthetic_data
+from .taskqueue import SUPERSEDED, claim_tasks, execute_task, heartbeat, requeue_stale, task
+from .templatetags.shop_extras import responsive_image
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        nature = Category.objects.create(name='Nature')
+        self.title = Product.objects.create(name='Nile Sunset', category=nature, base_price=10)
+        self.body = Product.objects.create(
+            name='Harbor Lights', category=nature, base_price=10, description='Boats at sunset in Alexandria',
+        )
+        self.other = Product.objects.create(name='City Skyline', category=nature, base_price=10)
+        Product.objects.create(name='Sunset Archive', category=nature, base_price=10, is_active=False)
+
+    def test_title_matches_rank_first_and_terms_match_as_prefixes(self):
+        self.assertEqual(search_product_ids('sunset'), [self.title.pk, self.body.pk])
+        self.assertEqual(search_product_ids('suns'), [self.title.pk, self.body.pk])
+        self.assertEqual(search_product_ids('sun alex'), [self.body.pk])
+        self.assertCountEqual(search_product_ids('nature'), [self.title.pk, self.body.pk, self.other.pk])
+        self.assertEqual(search_product_ids('!!'), [])
+
+    def test_index_follows_product_changes(self):
+        self.other.name = 'Sunset Skyline'
+        self.other.save()
+        self.assertIn(self.other.pk, search_product_ids('sunset'))
+        self.title.is_active = False
+        self.title.save()
+        self.assertNotIn(self.title.pk, search_product_ids('sunset'))
+
+        listings = search_listings(ProductListing.objects.all(), 'sunset')
+        self.assertEqual(list(listings.values_list('name', flat=True))[0], 'Sunset Skyline')
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        for n in range(23):
+            Product.objects.create(name=f'Poster {n % 4}', base_price=[10, 20, 30][n % 3])
+        # Ties on every sort key, so only the trailing primary key keeps the order total
+        ProductListing.objects.filter(pk__in=Product.objects.values('pk')[:12]).update(
+            created_at=timezone.now(), rating=4, rating_count=2,
+        )
+
+    def test_cursor_walk_visits_every_row_once_for_each_sort(self):
+        expected = sorted(ProductListing.objects.values_list('pk', flat=True))
+        for sort, ordering in SORT_ORDERINGS.items():
+            paginator = KeysetPaginator(ProductListing.objects.all(), 5, ordering=ordering)
+            seen, cursor = [], None
+            while True:
+                page = paginator.page(cursor)
+                seen.extend(listing.pk for listing in page)
+                if not page.has_next():
+                    break
+                cursor = page.next_cursor
+            self.assertEqual(sorted(seen), expected, sort)
+            self.assertEqual(seen, list(ProductListing.objects.order_by(*ordering).values_list('pk', flat=True)), sort)
+
+    def test_product_list_continues_past_the_numbered_pages_with_a_cursor(self):
+        first = self.client.get(reverse('product_list'), {'sort': 'price'})
+        self.assertEqual(first.context['total_count'], 23)
+        page_two = self.client.get(reverse('product_list'), {'sort': 'price', 'page': 2})
+        after = KeysetPaginator(ProductListing.objects.all(), 12, ordering=SORT_ORDERINGS['price'])
+        cursor = after.encode_cursor(first.context['page_obj'][-1])
+        by_cursor = self.client.get(reverse('product_list'), {'sort': 'price', 'cursor': cursor})
+        self.assertEqual(
+            [listing.pk for listing in by_cursor.context['page_obj']],
+            [listing.pk for listing in page_two.context['page_obj']],
+        )
+        self.assertEqual(self.client.get(reverse('product_list'), {'cursor': 'garbage'}).status_code, 200)
+
+
+class FacetFilterTests(TestCase):
+    def setUp(self):
+        nature = Category.objects.create(name='Nature')
+        cities = Category.objects.create(name='Cities')
+        # Priced by size and frame: 100, 35, 30 and 100
+        Product.objects.create(name='Forest', category=nature, base_price=10, size='A4', framed=True)
+        Product.objects.create(name='River', category=nature, base_price=10, size='A3')
+        Product.objects.create(name='Skyline', category=cities, base_price=10, size='A4')
+        Product.objects.create(name='Bridge', category=cities, base_price=10, size='A4', framed=True)
+
+    def counts(self, facets, name):
+        return {facet['value']: facet['count'] for facet in facets[name] if facet['count']}
+
+    def test_each_facet_ignores_its_own_filter(self):
+        filters = parse_filters(QueryDict('size=A4&category=nature&framed=1&size_junk=1&rating=9'))
+        self.assertEqual(filters, {'category': 'nature', 'size': 'A4', 'framed': True})
+        facets = facet_counts(ProductListing.objects.all(), filters)
+        # Sizes within nature + framed, categories within A4 + framed, frames within nature + A4
+        self.assertEqual(self.counts(facets, 'sizes'), {'A4': 1})
+        self.assertEqual(self.counts(facets, 'categories'), {'nature': 1, 'cities': 1})
+        self.assertEqual(self.counts(facets, 'frames'), {'1': 1})
+        self.assertEqual(self.counts(facets, 'prices'), {'100-': 1})
+
+        filters = parse_filters(QueryDict('size=A4'))
+        facets = facet_counts(ProductListing.objects.all(), filters)
+        self.assertEqual(self.counts(facets, 'sizes'), {'A4': 3, 'A3': 1})
+        self.assertEqual(self.counts(facets, 'prices'), {'0-50': 1, '100-': 2})
+        names = apply_filters(ProductListing.objects.order_by('name'), filters).values_list('name', flat=True)
+        self.assertEqual(list(names), ['Bridge', 'Forest', 'Skyline'])
+
+    def test_product_list_applies_filters_and_sort(self):
+        response = self.client.get(reverse('product_list'), {'size': 'A4', 'sort': '-price'})
+        # Equal prices fall back to the newest product first
+        self.assertEqual([listing.name for listing in response.context['page_obj']], ['Bridge', 'Forest', 'Skyline'])
+        self.assertEqual(response.context['total_count'], 3)
+
+
+class CategoryCounterTests(TestCase):
+    def setUp(self):
+        self.nature = Category.objects.create(name='Nature')
+        self.cities = Category.objects.create(name='Cities')
+
+    def assertCounts(self, nature, cities):
+        counts = dict(Category.objects.values_list('name', 'product_count'))
+        self.assertEqual((counts['Nature'], counts['Cities']), (nature, cities))
+
+    def test_counters_follow_activation_moves_and_deletes(self):
+        forest = Product.objects.create(name='Forest', category=self.nature, base_price=10)
+        river = Product.objects.create(name='River', category=self.nature, base_price=10)
+        hidden = Product.objects.create(name='Hidden', category=self.cities, base_price=10, is_active=False)
+        self.assertCounts(2, 0)
+
+        forest.is_active = False
+        forest.save()
+        self.assertCounts(1, 0)
+        forest.is_active = True
+        forest.save()
+        self.assertCounts(2, 0)
+
+        # Two copies loaded before either save: F() updates keep both moves
+        first, second = Product.objects.get(pk=forest.pk), Product.objects.get(pk=river.pk)
+        first.category = second.category = self.cities
+        first.save()
+        second.save()
+        self.assertCounts(0, 2)
+
+        hidden.is_active = True
+        hidden.save()
+        self.assertCounts(0, 3)
+
+        user = User.objects.create_user('reviewer')
+        review = Review.objects.create(product=forest, user=user, rating=5, comment='-')
+        review.delete()
+        self.assertCounts(0, 3)
+
+        # Stale copies of the same row: each save accounts for what is stored, not what was loaded
+        stale, fresh = Product.objects.get(pk=hidden.pk), Product.objects.get(pk=hidden.pk)
+        fresh.is_active = False
+        fresh.save()
+        stale.category = self.nature
+        stale.save()
+        self.assertCounts(1, 2)
+
+        river.delete()
+        self.assertCounts(1, 1)
+        recount_categories()
+        self.assertCounts(1, 1)
+
+
+class CartSummaryTests(TestCase):
+    def test_totals_come_from_one_aggregate_query(self):
+        user = User.objects.create_user('shopper')
+        product = Product.objects.create(name='Poster', base_price=10)
+        CartItem.objects.create(user=user, product=product, product_name='Poster', price=Decimal('30.00'), quantity=2)
+        CartItem.objects.create(user=user, product=product, product_name='Poster', price=Decimal('12.50'), quantity=1)
+        now = timezone.now()
+        promo = PromoCode.objects.create(
+            code='TEN', description='-', discount_value=10,
+            valid_from=now - timedelta(hours=1), valid_until=now + timedelta(hours=1),
+        )
+        cart = Cart.objects.select_related('promo_code').get(pk=Cart.objects.create(user=user, promo_code=promo).pk)
+
+        with self.assertNumQueries(1):
+            summary = cart.get_summary()
+            cart.get_total()
+            cart.get_item_count()
+        self.assertEqual((summary.subtotal, summary.item_count, summary.line_count), (Decimal('72.50'), 3, 2))
+        self.assertEqual((summary.discount, summary.total), (Decimal('7.25'), Decimal('65.25')))
+
+        empty = Cart.objects.create(user=User.objects.create_user('browser'))
+        with self.assertNumQueries(1):
+            summary = empty.get_summary()
+        self.assertEqual((summary.subtotal, summary.item_count, summary.total), (0, 0, 0))
+
+
+class SequenceTests(TestCase):
+    def test_reserve_block_returns_consecutive_ranges(self):
+        self.assertEqual(reserve_block('test', 10), (1, 11))
+        self.assertEqual(reserve_block('test', 5), (11, 16))
+        self.assertEqual(Sequence.objects.get(name='test').next_value, 16)
+
+    def test_order_gets_number_before_insert(self):
+        user = User.objects.create_user('buyer')
+        order = Order.objects.create(user=user, total_amount=10, shipping_address='Cairo', phone_number='1')
+        self.assertRegex(order.order_number, r'^RHINO\d{6}$')
+
+
+class OrderNumberAllocatorTests(TransactionTestCase):
+    workers = 8
+    allocations_per_worker = 150
+
+    def test_allocator_only_writes_once_per_block(self):
+        allocator = HiLoAllocator('block', block_size=10)
+        values = [allocator.allocate() for _ in range(25)]
+        self.assertEqual(values, list(range(1, 26)))
+        self.assertEqual(Sequence.objects.get(name='block').next_value, 31)
+
+    def test_concurrent_allocators_never_collide(self):
+        # Each thread stands in for a separate gunicorn worker with its own cached block
+        results = []
+        errors = []
+        start = threading.Barrier(self.workers)
+
+        def worker():
+            allocator = HiLoAllocator('stress', block_size=7)
+            try:
+                start.wait()
+                values = [allocator.allocate() for _ in range(self.allocations_per_worker)]
+                results.extend(values)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), self.workers * self.allocations_per_worker)
+        self.assertEqual(len(set(results)), len(results))
+
+    def test_values_taken_in_rolled_back_transaction_are_not_cached(self):
+        allocator = HiLoAllocator('rollback', block_size=50)
+        try:
+            with transaction.atomic():
+                inside = allocator.allocate()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        other = HiLoAllocator('rollback', block_size=50)
+        taken = [other.allocate() for _ in range(3)]
+        after = allocator.allocate()
+        self.assertIn(inside, taken)
+        self.assertNotIn(after, taken)
+
+
+class PromoCodeRedemptionTests(TestCase):
+    def make_code(self, **kwargs):
+        now = timezone.now()
+        defaults = dict(
+            code='FLASH25', description='Flash sale', discount_value=25, max_uses=2,
+            valid_from=now - timedelta(hours=1), valid_until=now + timedelta(hours=1),
+        )
+        defaults.update(kwargs)
+        return PromoCode.objects.create(**defaults)
+
+    def test_redeem_stops_at_max_uses(self):
+        promo = self.make_code()
+        stale = PromoCode.objects.get(pk=promo.pk)
+        self.assertTrue(promo.redeem())
+        self.assertTrue(stale.redeem())
+        self.assertFalse(promo.redeem())
+        self.assertFalse(stale.redeem())
+        promo.refresh_from_db()
+        self.assertEqual(promo.used_count, 2)
+
+    def test_unlimited_and_expired_codes(self):
+        unlimited = self.make_code(code='ALWAYS', max_uses=0)
+        expired = self.make_code(code='OLD', valid_until=timezone.now() - timedelta(minutes=1))
+        self.assertTrue(all(unlimited.redeem() for _ in range(5)))
+        self.assertFalse(expired.redeem())
+
+    def test_lookups_cache_known_codes_only_and_stay_bounded(self):
+        self.assertIsNone(lookup_promo_code('later'))
+        promo = self.make_code(code='LATER')
+        self.assertEqual(lookup_promo_code('later'), promo)
+        with self.assertNumQueries(0):
+            self.assertEqual(lookup_promo_code(' Later '), promo)
+
+        self.addCleanup(promotions._cache.clear)
+        with mock.patch.object(promotions, 'PROMO_CACHE_SIZE', 3):
+            for code in ('A', 'B', 'C', 'D'):
+                self.make_code(code=code)
+                lookup_promo_code(code)
+            self.assertEqual(list(promotions._cache), ['B', 'C', 'D'])
+
+    def test_checkout_with_the_last_use_gets_the_discount(self):
+        promo = self.make_code(code='HALF', discount_value=50, max_uses=1)
+        user = User.objects.create_user('shopper')
+        product = Product.objects.create(name='Poster', base_price=100)
+        CartItem.objects.create(user=user, product=product, product_name=product.name, price=100, quantity=1)
+        Cart.objects.create(user=user, promo_code=promo)
+        self.client.force_login(user)
+        self.client.post(reverse('checkout'), {'shipping_address': 'Cairo', 'phone_number': '01000000000'})
+        order = Order.objects.get(user=user)
+        self.assertEqual(order.total_amount, 50)
+        promo.refresh_from_db()
+        self.assertEqual(promo.used_count, 1)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper')
+        self.product = Product.objects.create(name='Poster', base_price=100)
+        self.item = CartItem.objects.create(
+            user=self.user, product=self.product, product_name=self.product.name, price=100, quantity=2,
+        )
+        self.client.force_login(self.user)
+
+    def submit(self, token='tok-1'):
+        return self.client.post(reverse('checkout'), {
+            'shipping_address': 'Cairo', 'phone_number': '01000000000', 'checkout_token': token,
+        })
+
+    def test_a_resubmitted_token_places_one_order(self):
+        first = self.submit()
+        CartItem.objects.create(user=self.user, product=self.product, product_name='Poster', price=100, quantity=1)
+        second = self.submit()
+        order = Order.objects.get(user=self.user)
+        self.assertRedirects(first, reverse('order_detail', args=[order.pk]))
+        self.assertRedirects(second, reverse('order_detail', args=[order.pk]))
+        self.assertEqual(order.items.get().quantity, 2)
+        # The item added afterwards stays in the cart
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.sales_count, 2)
+
+    def test_a_failure_rolls_the_whole_checkout_back(self):
+        promo = PromoCode.objects.create(
+            code='ONCE', discount_value=10, max_uses=5, valid_from=timezone.now() - timedelta(hours=1),
+            valid_until=timezone.now() + timedelta(hours=1),
+        )
+        Cart.objects.create(user=self.user, promo_code=promo)
+        with mock.patch('shop.views.bulk_increment', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.submit()
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertTrue(CartItem.objects.filter(pk=self.item.pk).exists())
+        self.assertEqual(Cart.objects.get(user=self.user).promo_code, promo)
+        promo.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((promo.used_count, self.product.sales_count), (0, 0))
+
+    def test_losing_the_token_race_shows_the_winning_order(self):
+        winner = Order.objects.create(
+            user=self.user, total_amount=200, shipping_address='Cairo', phone_number='1', checkout_token='tok-1',
+        )
+        with mock.patch('shop.views.place_order', side_effect=IntegrityError):
+            self.assertRedirects(self.submit(), reverse('order_detail', args=[winner.pk]))
+            # Any other integrity error is not a duplicate submit
+            with self.assertRaises(IntegrityError):
+                self.submit(token='tok-2')
+
+
+class ChunkedDesignUploadTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        settings = override_settings(MEDIA_ROOT=self.tmp, DESIGN_UPLOAD_DIR=f'{self.tmp}/partial')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user('designer', password='pw')
+        self.client.force_login(self.user)
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 1000), 'navy').save(buffer, 'PNG')
+        self.data = buffer.getvalue()
+
+    def start(self):
+        response = self.client.post(
+            reverse('design_upload_start'),
+            json.dumps({'filename': 'poster.png', 'size': len(self.data)}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()['upload_id']
+
+    def put(self, upload_id, offset, chunk):
+        return self.client.put(
+            reverse('design_upload_chunk', args=[upload_id]), chunk,
+            content_type='application/octet-stream', headers={'Upload-Offset': str(offset)},
+        )
+
+    def complete(self, upload_id, **extra):
+        return self.client.post(reverse('design_upload_complete', args=[upload_id]), {
+            'size': 'A4', 'framed': 'True', 'phone_number': '0100', **extra,
+        })
+
+    def test_resumed_upload_is_attached_to_a_design(self):
+        upload_id = self.start()
+        half = len(self.data) // 2
+        self.assertEqual(self.put(upload_id, 0, self.data[:half]).json()['offset'], half)
+
+        # A retried chunk at a stale offset is rejected with the offset to resume from
+        response = self.put(upload_id, 0, self.data[:half])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], half)
+        self.assertEqual(self.client.get(reverse('design_upload_chunk', args=[upload_id])).json()['offset'], half)
+
+        self.put(upload_id, half, self.data[half:])
+        response = self.complete(upload_id, sha256=hashlib.sha256(self.data).hexdigest())
+        self.assertTrue(response.json()['success'])
+
+        upload = DesignUpload.objects.get(pk=upload_id)
+        self.assertEqual(upload.status, 'completed')
+        self.assertEqual(upload.sha256, hashlib.sha256(self.data).hexdigest())
+        with upload.custom_design.design_file.open('rb') as fh:
+            self.assertEqual(fh.read(), self.data)
+        self.assertEqual(CartItem.objects.get(user=self.user).custom_design, upload.custom_design)
+
+    def test_checksum_and_image_checks(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, self.data)
+        self.assertEqual(self.complete(upload_id, sha256='0' * 64).status_code, 400)
+
+        self.data = b'not an image' * 100
+        upload_id = self.start()
+        self.put(upload_id, 0, self.data)
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not a supported image', response.json()['error'])
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_start_rejects_bodies_that_are_not_json_objects(self):
+        for body in ('[]', '"x"', '{"size": "big"}', 'not json'):
+            response = self.client.post(reverse('design_upload_start'), body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'success': False, 'error': 'Invalid request.'})
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        location = design_storage.location
+        design_storage.location = tmp
+        self.addCleanup(setattr, design_storage, 'location', location)
+        self.user = User.objects.create_user('artist')
+
+    def design(self, data):
+        design = CustomDesign(user=self.user, phone_number='0100')
+        design.design_file.save('art.PNG', ContentFile(data), save=True)
+        return design
+
+    def test_identical_uploads_share_one_blob(self):
+        first, second = self.design(b'same artwork'), self.design(b'same artwork')
+        other = self.design(b'other artwork')
+        self.assertEqual(first.design_file.name, second.design_file.name)
+        self.assertTrue(first.design_file.name.endswith(hashlib.sha256(b'same artwork').hexdigest() + '.png'))
+        self.assertNotEqual(first.design_file.name, other.design_file.name)
+        blob = StoredBlob.objects.get(name=first.design_file.name)
+        self.assertEqual((blob.ref_count, blob.size), (2, len(b'same artwork')))
+
+        first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertEqual(collect_garbage(), (0, 0))
+
+        path = design_storage.path(blob.name)
+        second.delete()
+        self.assertEqual(collect_garbage(), (1, len(b'same artwork')))
+        self.assertFalse(StoredBlob.objects.filter(name=blob.name).exists())
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(design_storage.exists(other.design_file.name))
+
+    def test_replacing_a_file_releases_the_old_blob(self):
+        design = self.design(b'draft')
+        design = CustomDesign.objects.get(pk=design.pk)
+        old_name = design.design_file.name
+        design.design_file.save('final.png', ContentFile(b'final'), save=True)
+        self.assertEqual(StoredBlob.objects.get(name=old_name).ref_count, 0)
+        self.assertEqual(StoredBlob.objects.get(name=design.design_file.name).ref_count, 1)
+
+    def test_saving_the_same_content_again_keeps_one_reference(self):
+        design = self.design(b'artwork')
+        name = design.design_file.name
+        design.design_file.save('again.png', ContentFile(b'artwork'), save=True)
+        design = CustomDesign.objects.get(pk=design.pk)
+        design.design_file.save('once more.png', ContentFile(b'artwork'), save=True)
+        # Saved to the file but never to the row, then replaced before the save
+        design.design_file.save('draft.png', ContentFile(b'draft'), save=False)
+        design.design_file.save('final.png', ContentFile(b'artwork'), save=False)
+        design.save()
+        self.assertEqual(design.design_file.name, name)
+        self.assertEqual(StoredBlob.objects.get(name=name).ref_count, 1)
+        self.assertEqual(StoredBlob.objects.get(name__endswith=hashlib.sha256(b'draft').hexdigest() + '.png').ref_count, 0)
+
+
+calls = []
+
+
+@task(name='tests.flaky', max_attempts=2, retry_delay=60)
+def flaky(value):
+    calls.append(value)
+    if value == 'fail':
+        raise ValueError('boom')
+
+
+@override_settings(TASK_QUEUE_EAGER=False)
+class TaskQueueTests(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_tasks_queued_in_a_rolled_back_transaction_vanish(self):
+        try:
+            with transaction.atomic():
+                flaky.delay('lost')
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(Task.objects.exists())
+
+    def test_unique_key_keeps_one_pending_copy(self):
+        first = flaky.enqueue(args=('a',), unique_key='only-once')
+        second = flaky.enqueue(args=('a',), unique_key='only-once')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_claimed_task_runs_once(self):
+        flaky.delay('ok')
+        claimed = claim_tasks('worker-1', 10)
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(claim_tasks('worker-2', 10), [])
+        self.assertEqual(execute_task(claimed[0].pk), Task.DONE)
+        self.assertEqual(calls, ['ok'])
+
+    def test_only_tasks_without_a_heartbeat_are_requeued(self):
+        slow, lost = flaky.delay('slow'), flaky.delay('lost')
+        claim_tasks('alive', 1)
+        claim_tasks('dead', 1)
+        # Both started long ago, but the live worker is still beating
+        Task.objects.update(started_at=timezone.now() - timedelta(hours=1), heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(heartbeat('alive'), 1)
+        self.assertEqual(requeue_stale(timedelta(minutes=2)), 1)
+        self.assertEqual(Task.objects.get(pk=slow.pk).status, Task.RUNNING)
+        self.assertEqual(Task.objects.get(pk=lost.pk).status, Task.QUEUED)
+
+    def test_eager_tasks_run_after_commit(self):
+        with override_settings(TASK_QUEUE_EAGER=True), transaction.atomic():
+            self.assertIsNone(flaky.delay('now'))
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, ['now'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        queued = flaky.delay('fail')
+        [claimed] = claim_tasks('worker', 1)
+        with self.assertLogs('shop.taskqueue', 'ERROR'):
+            self.assertEqual(execute_task(claimed.pk), Task.QUEUED)
+        queued.refresh_from_db()
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn('boom', queued.last_error)
+        self.assertGreater(queued.run_at, timezone.now() + timedelta(seconds=30))
+        self.assertEqual(claim_tasks('worker', 1), [])  # not due yet
+
+        Task.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        [claimed] = claim_tasks('worker', 1)
+        with self.assertLogs('shop.taskqueue', 'ERROR'):
+            self.assertEqual(execute_task(claimed.pk), Task.FAILED)
+        self.assertEqual(Task.objects.get(pk=queued.pk).status, Task.FAILED)
+
+    def test_requeue_leaves_the_work_to_a_queued_twin(self):
+        flaky.enqueue(args=('fail',), unique_key='derivatives:1')
+        [running] = claim_tasks('worker', 1)
+        twin = flaky.enqueue(args=('fail',), unique_key='derivatives:1')
+        self.assertNotEqual(twin.pk, running.pk)
+
+        with self.assertLogs('shop.taskqueue', 'ERROR'):
+            self.assertEqual(execute_task(running.pk), Task.FAILED)
+        running.refresh_from_db()
+        self.assertIn(SUPERSEDED, running.last_error)
+
+        Task.objects.filter(pk=running.pk).update(status=Task.RUNNING, heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale(timedelta(minutes=5)), 0)
+        self.assertEqual(Task.objects.get(pk=running.pk).status, Task.FAILED)
+
+        done = Task.objects.create(name=twin.name, unique_key='derivatives:1', status=Task.DONE)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        response = self.client.post(reverse('admin:shop_task_changelist'), {
+            'action': 'requeue', '_selected_action': [running.pk, done.pk, twin.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(Task.objects.filter(status=Task.QUEUED).values_list('pk', flat=True)), [twin.pk])
+
+
+class CounterBufferTests(TestCase):
+    def test_buffered_views_are_written_in_one_update(self):
+        category = Category.objects.create(name='Posters')
+        first = Product.objects.create(name='One', category=category, base_price=10)
+        second = Product.objects.create(name='Two', category=category, base_price=10)
+        buffer = CounterBuffer(Product, 'views_count', interval=3600)
+        for pk in (first.pk, second.pk, first.pk, first.pk):
+            buffer.add(pk)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(
+            dict(Product.objects.values_list('pk', 'views_count')),
+            {first.pk: 3, second.pk: 1},
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(buffer.flush(), 0)
+
+
+class ProductRatingTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Posters')
+        self.product = Product.objects.create(name='One', category=category, base_price=10)
+        self.other = Product.objects.create(name='Two', category=category, base_price=10)
+        self.users = [User.objects.create_user(f'reviewer{i}') for i in range(3)]
+
+    def assertRating(self, product, rating, count):
+        product = Product.objects.get(pk=product.pk)
+        self.assertEqual((product.rating, product.rating_count), (Decimal(rating), count))
+        listing = ProductListing.objects.get(pk=product.pk)
+        self.assertEqual((listing.rating, listing.rating_count), (Decimal(rating), count))
+
+    def review(self, user, rating, approved=True):
+        return Review.objects.create(product=self.product, user=user, rating=rating, comment='-', is_approved=approved)
+
+    def test_totals_follow_approval_edits_and_deletes(self):
+        self.review(self.users[0], 5)
+        pending = self.review(self.users[1], 2, approved=False)
+        self.assertRating(self.product, '5.00', 1)
+
+        # Approving through the admin changelist loads the row and saves it again
+        pending = Review.objects.get(pk=pending.pk)
+        pending.is_approved = True
+        pending.save()
+        self.assertRating(self.product, '3.50', 2)
+
+        pending.rating = 3
+        pending.save()
+        self.assertRating(self.product, '4.00', 2)
+
+        pending.product = self.other
+        pending.save()
+        self.assertRating(self.product, '5.00', 1)
+        self.assertRating(self.other, '3.00', 1)
+
+        pending.delete()
+        self.assertRating(self.other, '0', 0)
+
+    def test_saving_a_stale_product_keeps_the_totals(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        self.review(self.users[0], 4)
+        stale.name = 'Renamed'
+        stale.save()
+        self.assertRating(self.product, '4.00', 1)
+
+    def test_recount_repairs_drift(self):
+        for user, rating in zip(self.users, (5, 4, 4)):
+            self.review(user, rating)
+        Product.objects.filter(pk=self.product.pk).update(rating_sum=0, rating_count=7, rating=1)
+        self.assertEqual(recount_ratings(), 1)
+        self.assertRating(self.product, '4.33', 3)
+
+
+class RecommendationTests(TestCase):
+    def test_copurchases_rank_first_and_category_peers_fill_in(self):
+        posters, frames = Category.objects.create(name='Posters'), Category.objects.create(name='Frames')
+        a, b, c = (Product.objects.create(name=name, category=posters, base_price=10) for name in 'abc')
+        bestseller = Product.objects.create(name='d', category=posters, base_price=10)
+        Product.objects.filter(pk=bestseller.pk).update(sales_count=50)
+        lonely = Product.objects.create(name='e', category=frames, base_price=10)
+        user = User.objects.create_user('shopper')
+        for basket in ([a, b], [a, b], [a, c]):
+            order = Order.objects.create(user=user, total_amount=10, shipping_address='Cairo', phone_number='1')
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, product_name=product.name, price=10) for product in basket
+            ])
+
+        build_recommendations(top_k=3)
+
+        def recommended(product):
+            return list(
+                ProductRecommendation.objects.filter(product=product)
+                .values_list('recommended__name', 'source')
+            )
+        self.assertEqual(recommended(a), [('b', 'copurchase'), ('c', 'copurchase'), ('d', 'category')])
+        self.assertEqual(recommended(b)[:2], [('a', 'copurchase'), ('d', 'category')])
+        self.assertEqual(recommended(lonely), [])
+
+
+class ResponsiveImageTests(TestCase):
+    def test_srcset_advertises_the_real_derivative_widths(self):
+        html = responsive_image('/media/small.png', 'ab' * 32, 'detail', width=600)
+        self.assertIn('/thumb.webp 160w', html)
+        self.assertIn('/card.webp 480w', html)
+        self.assertIn('/detail.webp 600w', html)
+        self.assertNotIn('1200w', html)
+        self.assertIn('1200w', responsive_image('/media/big.png', 'ab' * 32, 'detail', width=3000))
+        # Widths not recorded yet: the original, without a srcset
+        self.assertNotIn('srcset', responsive_image('/media/old.png', 'ab' * 32, 'detail'))
+
+
+class CategoryCacheTests(TestCase):
+    def test_a_bump_in_another_process_reloads_the_menu(self):
+        Category.objects.create(name='Posters')
+        self.assertEqual([c.name for c in get_active_categories()], ['Posters'])
+        # bulk_create skips the signal; a separate client stands in for another worker's bump
+        Category.objects.bulk_create([Category(name='Frames', slug='frames')])
+        self.assertEqual(len(get_active_categories()), 1)
+        caches.create_connection('default').incr('rhino:version:categories')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(get_active_categories()), 1)
+        later = time.monotonic() + VERSION_CHECK_INTERVAL
+        with mock.patch('shop.caching.time.monotonic', return_value=later):
+            self.assertEqual(len(get_active_categories()), 2)
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Posters')
+        self.product = Product.objects.create(name='Skyline', category=category, base_price=10)
+        self.url = reverse('product_detail', args=[self.product.slug])
+        # The hits would otherwise be flushed at exit, after the test database is gone
+        self.addCleanup(product_views.discard)
+
+    def test_anonymous_pages_are_cached_until_the_catalog_changes(self):
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'utm_source': 'mail'})
+        self.assertEqual(response['X-Cache'], 'HIT')
+        # Only the page itself; the version stamp was read moments ago
+        self.assertEqual(len(queries), 1)
+        self.assertIn('rhino_cache', queries[0]['sql'])
+        self.assertContains(response, 'Skyline')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Skyline at night'
+            self.product.save()
+            # Until the change commits, requests keep the cached page rather than re-cache the old row
+            self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, 'Skyline at night')
+
+    def test_expired_page_is_served_stale_while_another_worker_rebuilds(self):
+        self.client.get(self.url)
+        key = versioned_key('catalog', 'page', self.url, [])
+        expired, response = cache.get(key)
+        cache.set(key, (0, response))
+        # Taken through a separate cache client, as another process would
+        other_worker = caches.create_connection('default')
+        self.assertTrue(other_worker.add(f'{key}:lock', 1))
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'STALE')
+
+        other_worker.delete(f'{key}:lock')
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+
+    def test_signed_in_users_bypass_the_cache(self):
+        self.client.get(self.url)
+        self.client.force_login(User.objects.create_user('shopper'))
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('X-Cache'))
+        self.assertContains(response, 'Add to Cart')
+
+
+class OrderHistoryTests(TestCase):
+    def test_query_count_does_not_grow_with_orders(self):
+        user = User.objects.create_user('shopper')
+        for n in range(12):
+            order = Order.objects.create(user=user, total_amount=10, shipping_address='Cairo', phone_number='1')
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_name=f'Poster {n}-{i}', price=10) for i in range(n % 5 + 1)
+            ])
+        self.client.force_login(user)
+        get_active_categories()
+
+        # Session, user, orders with counts, preview items
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('my_orders'))
+        orders = list(response.context['orders'])
+        self.assertEqual(len(orders), 10)
+        self.assertEqual([len(order.preview_items) for order in orders[:5]], [2, 1, 3, 3, 3])
+        self.assertEqual([order.item_count for order in orders[:5]], [2, 1, 5, 4, 3])
+        self.assertContains(response, '+2 more items')
+
+        response = self.client.get(reverse('my_orders'), {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual([order.item_count for order in response.context['orders']], [2, 1])
+        self.assertFalse(response.context['page_obj'].has_next())
+
+
+class OrderAdminActionTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(self.admin)
+        for n in range(3):
+            order = Order.objects.create(user=self.admin, total_amount=20, shipping_address='Cairo', phone_number='1')
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_name=f'Poster {n}-{i}', price=10) for i in range(n)
+            ])
+
+    def run_action(self, action):
+        return self.client.post(reverse('admin:shop_order_changelist'), {
+            'action': action, 'select_across': '1', 'index': '0',
+            '_selected_action': list(Order.objects.values_list('pk', flat=True)),
+        })
+
+    def test_status_action_updates_every_selected_order(self):
+        self.run_action('mark_shipped')
+        self.assertEqual(set(Order.objects.values_list('status', flat=True)), {'shipped'})
+
+    def test_exports_stream_orders_with_their_items(self):
+        response = self.run_action('export_csv')
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        # The order without items still gets a row
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(sorted(row['product_name'] for row in rows), ['', 'Poster 1-0', 'Poster 2-0', 'Poster 2-1'])
+
+        response = self.run_action('export_jsonl')
+        orders = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([len(order['items']) for order in orders], [0, 1, 2])
+        self.assertEqual(orders[2]['email'], 'admin@example.com')
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        Image.new('RGB', (800, 600), 'red').save(os.path.join(self.media, 'sunset.png'))
+        self.existing = Product.objects.create(name='Sunset', base_price=10)
+
+    def rows(self, **changes):
+        rows = [
+            {'sku': 'P-1', 'name': 'Sunset', 'base_price': '40', 'size': 'a3', 'framed': 'yes',
+             'category': 'Nature', 'image': 'sunset.png'},
+            {'sku': 'P-2', 'name': 'Sunset', 'base_price': '30', 'category': 'Nature'},
+            {'sku': 'P-3', 'name': 'Skyline', 'base_price': 'cheap'},
+        ]
+        rows[0].update(changes)
+        return rows
+
+    def test_import_is_bulk_and_idempotent(self):
+        stats, errors = import_catalog(self.rows(), image_root=self.media, batch_size=10)
+        self.assertEqual((stats['created'], stats['skipped']), (2, 1))
+        self.assertEqual(errors, ['row 3: base_price must be a number'])
+
+        first, second = Product.objects.get(sku='P-1'), Product.objects.get(sku='P-2')
+        self.assertEqual(
+            sorted(Product.objects.values_list('slug', flat=True)), ['sunset', 'sunset-2', 'sunset-3'],
+        )
+        self.assertEqual((first.size, first.framed, first.final_price), ('A3', True, 105))
+        self.assertTrue(first.image.name.startswith('products/imported/'))
+        self.assertEqual(len(first.image_hash), 64)
+        self.assertEqual(first.image_width, 800)
+        self.assertEqual(first.category.product_count, 2)
+        listing = ProductListing.objects.get(pk=first.pk)
+        self.assertEqual(
+            (listing.category_name, listing.image_hash, listing.image_width), ('Nature', first.image_hash, 800),
+        )
+        self.assertTrue(ProductListing.objects.filter(pk=second.pk).exists())
+
+        stats, _ = import_catalog(self.rows(), image_root=self.media)
+        self.assertEqual((stats['created'], stats['updated'], stats['unchanged']), (0, 0, 2))
+
+        stats, _ = import_catalog(self.rows(is_active='no'), image_root=self.media)
+        self.assertEqual(stats['updated'], 1)
+        self.assertFalse(ProductListing.objects.filter(pk=first.pk).exists())
+        self.assertEqual(Category.objects.get(name='Nature').product_count, 1)
+
+    def test_bad_images_fail_their_own_row_only(self):
+        Image.new('RGB', (800, 600), 'blue').save(os.path.join(self.media, 'huge.png'))
+        with open(os.path.join(self.media, 'broken.png'), 'wb') as fh:
+            fh.write(b'\x89PNG\r\n\x1a\n not really')
+        rows = self.rows()[:2]
+        rows[0]['image'], rows[1]['image'] = 'huge.png', 'broken.png'
+        # 480,000 pixels is more than twice the limit, which Pillow refuses as a decompression bomb
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 200_000):
+            stats, errors = import_catalog(rows, image_root=self.media)
+        self.assertEqual((stats['created'], stats['image_errors']), (2, 2))
+        self.assertEqual([error.split(':')[0] for error in errors], ['row 1', 'row 2'])
+        self.assertIn('decompression bomb', errors[0])
+        self.assertFalse(Product.objects.filter(sku__in=['P-1', 'P-2']).exclude(image='').exists())
+
+    def test_save_picks_a_free_slug(self):
+        self.assertEqual(Product.objects.create(name='Sunset', base_price=10).slug, 'sunset-2')
+
+
+class PrintFileTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.source = os.path.join(self.tmp, 'art.png')
+        Image.new('RGB', (400, 200), 'red').save(self.source)
+        # A low resolution keeps the renders small; 3 mm of bleed and 10 mm of safe margin as in production
+        self.settings = PrintSettings(fmt='tiff', dpi=50)
+
+    def render(self, framed):
+        name = print_file_name('ab' * 32, 'A5', framed, self.settings)
+        path = os.path.join(self.tmp, name)
+        return path, prepare_job(self.source, path, 'A5', framed, self.settings)
+
+    def test_canvas_is_the_trim_size_plus_bleed(self):
+        # A5 is 148 x 210 mm: 291 x 413 px at 50 dpi, plus 6 px of bleed on every side
+        self.assertEqual(canvas_size('A5', self.settings), (303, 425))
+        self.assertEqual(canvas_size('A5', self.settings, landscape=True), (425, 303))
+
+    def test_framed_artwork_stays_inside_the_safe_margin(self):
+        path, result = self.render(framed=True)
+        self.assertFalse(result.cached)
+        with Image.open(path) as image:
+            # Printed in the artwork's landscape orientation
+            self.assertEqual(image.size, (425, 303))
+            self.assertEqual(round(image.info['dpi'][0]), 50)
+            inset = mm_to_px(BLEED_MM + FRAME_SAFE_MM, 50)
+            middle = image.height // 2
+            self.assertEqual(image.getpixel((inset - 1, middle)), (255, 255, 255))
+            self.assertEqual(image.getpixel((inset, middle)), (255, 0, 0))
+            self.assertEqual(image.getpixel((image.width - inset, middle)), (255, 255, 255))
+            self.assertEqual(image.getpixel((0, 0)), (255, 255, 255))
+
+    def test_frameless_artwork_runs_into_the_bleed(self):
+        path, _ = self.render(framed=False)
+        with Image.open(path) as image:
+            self.assertEqual(image.size, (425, 303))
+            self.assertEqual(image.getpixel((0, 0)), (255, 0, 0))
+            self.assertEqual(image.getpixel((424, 302)), (255, 0, 0))
+
+    def test_print_files_are_rendered_once_per_variant(self):
+        path, first = self.render(framed=True)
+        rendered_at = os.path.getmtime(path)
+        _, again = self.render(framed=True)
+        self.assertEqual((first.cached, again.cached), (False, True))
+        self.assertEqual(os.path.getmtime(path), rendered_at)
+        self.assertFalse(prepare_job(self.source, path, 'A5', True, self.settings, force=True).cached)
+        # The safe margin only matters behind a frame
+        wider = self.settings._replace(safe_mm=15)
+        for framed, same in ((True, False), (False, True)):
+            names = {print_file_name('ab' * 32, 'A5', framed, options) for options in (self.settings, wider)}
+            self.assertEqual(len(names) == 1, same)
+
+
+class SyntheticDataBenchmarkTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_benchmark_covers_every_route_and_leaves_the_data_alone(self):
+        counts = generate(Scale(users=5, categories=2, products=30, reviews=20, orders=15, carts=3), seed=1)
+        self.assertEqual(counts['orders'], 15)
+
+        def state():
+            return (
+                Order.objects.count(), Review.objects.count(), CartItem.objects.count(),
+                Product.objects.aggregate(views=Sum('views_count'))['views'],
+            )
+        before = state()
+
+        report = run_benchmark(iterations=1, warmup=0)
+        product_views.flush()
+        self.assertEqual(state(), before)
+        self.assertEqual(os.listdir(self.media), [])
+        self.assertEqual(report['meta']['data']['orders'], 15)
+        self.assertIn('checkout submit', report['results'])
+        self.assertIn('remove_promo_code', report['results'])
+        self.assertEqual(report['results']['checkout submit']['status'], {'302': 1})
+        self.assertIn('p95', report['results']['product_list']['latency_ms'])
+
+        remove_synthetic_data()
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(Order.objects.exists())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.staff = User.objects.create_user('ops', password='pw', is_staff=True)
+
+    def test_requests_are_recorded_per_route(self):
+        self.client.get(reverse('product_list'))
+        self.client.get(reverse('product_list'))
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('rhino_http_requests_total{route="product_list",method="GET",status="200"} 2', body)
+        self.assertIn('rhino_http_request_duration_seconds_count{route="product_list"} 2', body)
+        self.assertIn('rhino_db_queries_per_request_bucket{route="product_list",le="+Inf"} 2', body)
+        self.assertIn('rhino_template_render_seconds_count{route="product_list"} 2', body)
+        self.assertIn('rhino_db_query_seconds_total{route="product_list"}', body)
+        product_list = registry.routes['product_list']
+        self.assertGreater(product_list.queries.sum, 0)
+        self.assertGreater(product_list.template_seconds.sum, 0)
+        self.assertGreater(product_list.response_size.sum, 0)
+
+    def test_only_staff_or_the_token_can_scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 302)
+        with self.settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer nope').status_code, 403)
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
@@ -0,0 +1,168 @@
+import hashlib
+import os
+from datetime import timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from .models import DesignUpload
+
+CHUNK_SIZE = 1024 * 1024  # suggested to clients
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_UPLOAD_SIZE = 100 * 1024 * 1024
+READ_BLOCK = 64 * 1024
+MIN_DIMENSION = 600
+IMAGE_FORMATS = {'JPEG', 'PNG', 'WEBP', 'TIFF'}
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def partial_path(upload):
+    return os.path.join(settings.DESIGN_UPLOAD_DIR, f'{upload.pk}.part')
+
+
+def _lock(fh):
+    if fcntl is not None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+
+
+def _open_partial(upload, mode):
+    try:
+        return open(partial_path(upload), mode)
+    except FileNotFoundError:
+        raise UploadError('This upload has expired, please start again.', status=410)
+
+
+def start_upload(user, filename, total_size):
+    if total_size <= 0 or total_size > MAX_UPLOAD_SIZE:
+        raise UploadError(f'Designs must be smaller than {MAX_UPLOAD_SIZE // (1024 * 1024)} MB.')
+    filename = os.path.basename(filename.replace('\\', '/'))[:255] or 'design'
+    upload = DesignUpload.objects.create(user=user, filename=filename, total_size=total_size)
+    os.makedirs(settings.DESIGN_UPLOAD_DIR, exist_ok=True)
+    open(partial_path(upload), 'wb').close()
+    return upload
+
+
+def write_chunk(upload, offset, stream, length):
+    """Stream one chunk from `stream` to the partial file at `offset`.
+
+    The offset must match what the server has already received, so a client
+    that lost a response simply asks for the current offset and carries on.
+    """
+    if upload.status != 'uploading':
+        raise UploadError('This upload is already complete.', status=409, offset=upload.received_size)
+    if not 0 < length <= MAX_CHUNK_SIZE:
+        raise UploadError('Invalid chunk size.', offset=upload.received_size)
+
+    with _open_partial(upload, 'r+b') as fh:
+        _lock(fh)
+        # Another request may have advanced the upload while we waited for the lock
+        upload.refresh_from_db(fields=['received_size'])
+        if offset != upload.received_size:
+            raise UploadError('Offset mismatch.', status=409, offset=upload.received_size)
+        if offset + length > upload.total_size:
+            raise UploadError('Chunk runs past the declared size.', offset=upload.received_size)
+
+        fh.seek(offset)
+        fh.truncate()  # drop whatever an interrupted chunk left behind
+        written = 0
+        while written < length:
+            block = stream.read(min(READ_BLOCK, length - written))
+            if not block:
+                break
+            fh.write(block)
+            written += len(block)
+        if written != length:
+            raise UploadError('Incomplete chunk.', offset=offset)
+        fh.flush()
+
+        upload.received_size = offset + length
+        DesignUpload.objects.filter(pk=upload.pk).update(
+            received_size=upload.received_size, updated_at=timezone.now()
+        )
+    return upload.received_size
+
+
+def inspect_design(path):
+    """Identify the file from its header without decoding the pixel data"""
+    with open(path, 'rb') as fh:
+        if fh.read(5) == b'%PDF-':
+            return 'PDF', None
+    try:
+        # Image.open only parses the header; pixels are decoded lazily on load()
+        with Image.open(path) as image:
+            image_format, size = image.format, image.size
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise UploadError('The file is not a supported image.')
+    if image_format not in IMAGE_FORMATS:
+        raise UploadError('Please upload a JPG, PNG, WebP, TIFF or PDF file.')
+    if min(size) < MIN_DIMENSION:
+        raise UploadError(f'The design must be at least {MIN_DIMENSION} pixels on each side.')
+    if Image.MAX_IMAGE_PIXELS and size[0] * size[1] > Image.MAX_IMAGE_PIXELS:
+        raise UploadError('The design is too large to print.')
+    return image_format, size
+
+
+def finish_upload(upload, design, expected_sha256=None):
+    """Verify the received file and attach it to an unsaved CustomDesign"""
+    if upload.status != 'uploading':
+        raise UploadError('This upload is already complete.', status=409, offset=upload.received_size)
+    if upload.received_size != upload.total_size:
+        raise UploadError('The upload is not finished yet.', status=409, offset=upload.received_size)
+
+    path = partial_path(upload)
+    with _open_partial(upload, 'rb') as fh:
+        _lock(fh)
+        # Hashed once, here: chunks may land on different workers and be retried
+        digest = hashlib.sha256()
+        for block in iter(lambda: fh.read(READ_BLOCK), b''):
+            digest.update(block)
+        sha256 = digest.hexdigest()
+        if expected_sha256 and expected_sha256.lower() != sha256:
+            raise UploadError('The file was corrupted in transit, please upload it again.')
+        inspect_design(path)
+
+        with transaction.atomic():
+            claimed = DesignUpload.objects.filter(pk=upload.pk, status='uploading').update(
+                status='completed', sha256=sha256, updated_at=timezone.now()
+            )
+            if not claimed:
+                raise UploadError('This upload is already complete.', status=409)
+            design.user_id = upload.user_id
+            content = File(fh)
+            content.sha256 = sha256  # already hashed, so the storage needn't read it twice
+            design.design_file.save(upload.filename, content, save=False)
+            design.save()
+            design.add_to_cart()
+            DesignUpload.objects.filter(pk=upload.pk).update(custom_design=design)
+
+    os.remove(path)
+    upload.status, upload.sha256, upload.custom_design = 'completed', sha256, design
+    return design
+
+
+def purge_stale_uploads(max_age=timedelta(days=2)):
+    """Delete unfinished uploads (and their partial files) untouched for `max_age`"""
+    stale = DesignUpload.objects.filter(status='uploading', updated_at__lt=timezone.now() - max_age)
+    count = 0
+    for upload in stale.iterator():
+        try:
+            os.remove(partial_path(upload))
+        except FileNotFoundError:
+            pass
+        upload.delete()
+        count += 1
+    return count
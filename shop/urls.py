@@ -9,10 +9,14 @@ urlpatterns = [
     path('search/', views.shop_search, name='shop_search'),
 
     path('upload-design/', views.upload_custom_design, name='upload_custom_design'),
+    path('upload-design/chunked/', views.design_upload_start, name='design_upload_start'),
+    path('upload-design/chunked/<uuid:upload_id>/', views.design_upload_chunk, name='design_upload_chunk'),
+    path('upload-design/chunked/<uuid:upload_id>/complete/', views.design_upload_complete, name='design_upload_complete'),
     path('design-success/', views.custom_design_success, name='custom_design_success'),
     path('signup/', views.signup, name='signup'),
     path('checkout/', views.checkout, name='checkout'),
     path('order/<int:order_id>/', views.order_detail, name='order_detail'),
     path('my-orders/', views.my_orders, name='my_orders'),
     path('add-review/<int:product_id>/', views.add_review, name='add_review'),
+    path('tasks/stats/', views.task_stats, name='task_stats'),
 ]
@@ -1,19 +1,50 @@
+import json
+import uuid
+from collections import Counter
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Prefetch, prefetch_related_objects
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+from django.urls import reverse
 
-from .forms import CustomDesignForm, ReviewForm, OrderForm, ContactForm
+from .forms import CustomDesignForm, CustomDesignDetailsForm, ReviewForm, OrderForm, ContactForm
 from .forms import CustomSignUpForm
 from django.contrib.auth import login
-from .models import Product, CustomDesign, Review, Order, OrderItem, Category
+from .counters import bulk_increment, record_product_view
+from .sequences import next_order_number
+from .tasks import send_order_confirmation
+from .taskqueue import queue_stats
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics
+from .promotions import PromoCodeUnavailable, forget_promo_code
+from .caching import cache_anonymous_page, versioned_key, get_active_categories
+from .pagination import CachedCountPaginator, KeysetPaginator, NUMBERED_PAGES
+from .listings import (
+    SORT_ORDERINGS, DEFAULT_SORT, parse_filters, apply_filters, facet_counts,
+)
+from .search import search_listings
+from .uploads import UploadError, CHUNK_SIZE, start_upload, write_chunk, finish_upload
+from .models import Product, ProductListing, DesignUpload, Review, Order, OrderItem
 from cart.models import CartItem, Cart
 
+PRODUCTS_PER_PAGE = 12
+ORDERS_PER_PAGE = 10
+ORDER_PREVIEW_ITEMS = 3
+# Query parameters that change the product list page; the page cache ignores the rest
+PRODUCT_LIST_PARAMS = ('category', 'search', 'page', 'sort', 'cursor', 'size', 'framed', 'price', 'rating')
+
+@cache_anonymous_page()
 def shop_home(request):
-    featured_products = Product.objects.filter(featured=True, is_active=True)[:8]
-    categories = Category.objects.filter(is_active=True)[:6]
-    latest_products = Product.objects.filter(is_active=True)[:4]
+    featured_products = ProductListing.objects.filter(featured=True)[:8]
+    categories = get_active_categories(request)[:6]
+    latest_products = ProductListing.objects.all()[:4]
     
     context = {
         'featured_products': featured_products,
@@ -22,38 +53,80 @@ def shop_home(request):
     }
     return render(request, 'shop/home.html', context)
 
+@cache_anonymous_page(PRODUCT_LIST_PARAMS)
 def product_list(request):
-    products = Product.objects.filter(is_active=True)
-    category = request.GET.get('category')
+    products = ProductListing.objects.all()
     search = request.GET.get('search')
-    
-    if category:
-        products = products.filter(category__slug=category)
+    cursor = request.GET.get('cursor')
+    sort = request.GET.get('sort')
+    if sort not in SORT_ORDERINGS:
+        sort = None
+    filters = parse_filters(request.GET)
     
     if search:
-        products = products.filter(
-            Q(name__icontains=search) | 
-            Q(description__icontains=search) |
-            Q(category__name__icontains=search)
-        )
+        products = search_listings(products, search)
     
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # One grouped query over the search results drives every facet count
+    facets = facet_counts(products, filters)
+    products = apply_filters(products, filters)
+    
+    # Search hits keep their relevance order unless a sort was picked
+    ordering = SORT_ORDERINGS[sort or DEFAULT_SORT]
+    if sort or not search:
+        products = products.order_by(*ordering)
+    
+    # Counts are cached per filter and dropped whenever the catalog changes
+    paginator = CachedCountPaginator(
+        products, PRODUCTS_PER_PAGE,
+        count_key=versioned_key('catalog', 'product_count', search, sorted(filters.items())),
+        max_pages=NUMBERED_PAGES if sort or not search else None,
+    )
+    keyset = KeysetPaginator(products, PRODUCTS_PER_PAGE, ordering=ordering)
+    next_cursor = None
+    if cursor and (sort or not search):
+        page_obj = keyset.page(cursor)
+    else:
+        page_obj = paginator.get_page(request.GET.get('page'))
+        if page_obj.number == paginator.num_pages and paginator.has_more_pages:
+            next_cursor = keyset.encode_cursor(page_obj[-1])
     
-    categories = Category.objects.filter(is_active=True)
+    categories = get_active_categories(request)
     
     context = {
         'page_obj': page_obj,
+        'total_count': paginator.count,
+        'next_cursor': next_cursor,
         'categories': categories,
-        'current_category': category,
+        'facets': facets,
+        'filters': filters,
+        'current_category': filters.get('category'),
+        'current_size': filters.get('size'),
+        'current_framed': request.GET.get('framed') if 'framed' in filters else None,
+        'current_price': filters.get('price'),
+        'current_rating': request.GET.get('rating') if 'rating' in filters else None,
+        'current_sort': sort,
         'search': search,
     }
     return render(request, 'shop/product_list.html', context)
 
 def product_detail(request, slug):
+    response = _product_detail_page(request, slug)
+    # Counted outside the page cache so cached views still count
+    if request.method == 'GET' and response.status_code == 200:
+        record_product_view(slug)
+    return response
+
+@cache_anonymous_page()
+def _product_detail_page(request, slug):
     product = get_object_or_404(Product, slug=slug, is_active=True)
-    related_products = Product.objects.filter(category=product.category, is_active=True).exclude(id=product.id)[:4]
+    # Precomputed by build_recommendations; one lookup on the (product, rank) index
+    related_products = list(
+        Product.objects.filter(recommended_in__product=product, is_active=True)
+        .order_by('recommended_in__rank')[:4]
+    )
+    if not related_products:
+        # Added since the last batch run
+        related_products = Product.objects.filter(category=product.category, is_active=True).exclude(id=product.id)[:4]
     reviews = Review.objects.filter(product=product, is_approved=True)[:5]
     
     if request.method == 'POST' and request.user.is_authenticated:
@@ -79,12 +152,7 @@ def product_detail(request, slug):
 def shop_search(request):
     query = request.GET.get("q", "")
     if query:
-        results = Product.objects.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query),
-            is_active=True
-        )
+        results = search_listings(ProductListing.objects.all(), query)
     else:
         results = []
     
@@ -137,6 +205,74 @@ def upload_custom_design(request):
     
     return render(request, 'shop/upload_design.html', {'form': form})
 
+def _upload_error(error):
+    data = {'success': False, 'error': str(error)}
+    if error.offset is not None:
+        data['offset'] = error.offset
+    return JsonResponse(data, status=error.status)
+
+@login_required
+def design_upload_start(request):
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request.'}, status=405)
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            raise ValueError('expected a JSON object')
+        total_size = int(data.get('size'))
+    except (ValueError, TypeError):
+        return JsonResponse({'success': False, 'error': 'Invalid request.'}, status=400)
+    try:
+        upload = start_upload(request.user, str(data.get('filename') or ''), total_size)
+    except UploadError as error:
+        return _upload_error(error)
+    return JsonResponse({
+        'success': True,
+        'upload_id': str(upload.pk),
+        'offset': 0,
+        'chunk_size': CHUNK_SIZE,
+    }, status=201)
+
+@login_required
+def design_upload_chunk(request, upload_id):
+    """GET reports how much has been received; PUT appends the chunk at Upload-Offset"""
+    upload = get_object_or_404(DesignUpload, pk=upload_id, user=request.user)
+    if request.method == 'GET':
+        return JsonResponse({
+            'success': True,
+            'offset': upload.received_size,
+            'size': upload.total_size,
+            'status': upload.status,
+        })
+    if request.method != 'PUT':
+        return JsonResponse({'success': False, 'error': 'Invalid request.'}, status=405)
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.headers.get('Content-Length', ''))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Upload-Offset and Content-Length are required.'}, status=400)
+    try:
+        # Read the body as a stream so the chunk is never held in memory
+        received = write_chunk(upload, offset, request, length)
+    except UploadError as error:
+        return _upload_error(error)
+    return JsonResponse({'success': True, 'offset': received, 'size': upload.total_size})
+
+@login_required
+def design_upload_complete(request, upload_id):
+    upload = get_object_or_404(DesignUpload, pk=upload_id, user=request.user)
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request.'}, status=405)
+    form = CustomDesignDetailsForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'success': False, 'error': 'Please correct the errors below.', 'errors': form.errors}, status=400)
+    try:
+        custom_design = finish_upload(upload, form.save(commit=False), request.POST.get('sha256'))
+    except UploadError as error:
+        return _upload_error(error)
+    messages.success(request, f"Your custom design has been added to cart! Total: {custom_design.calculate_price()} LE")
+    return JsonResponse({'success': True, 'redirect': reverse('cart_view')})
+
 def custom_design_success(request):
     return render(request, 'shop/custom_design_success.html')
 
@@ -158,56 +294,103 @@ def checkout(request):
     if request.method == 'POST':
         form = OrderForm(request.POST)
         if form.is_valid():
-            cart_items = CartItem.objects.filter(user=request.user)
-            if not cart_items.exists():
+            token = form.cleaned_data['checkout_token'] or None
+            try:
+                order = place_order(request, form, token)
+            except PromoCodeUnavailable:
+                cart = Cart.for_request(request)
+                forget_promo_code(cart.promo_code.code)
+                cart.set_promo_code(None)
+                messages.error(request, "Sorry, your promo code is no longer available. Please review your new total.")
+                return redirect('checkout')
+            except IntegrityError:
+                # A concurrent submit with the same token won the race
+                order = Order.objects.filter(user=request.user, checkout_token=token).first()
+                if order is None:
+                    raise
+            if order is None:
                 messages.error(request, "Your cart is empty!")
                 return redirect('cart_view')
             
-            # Get cart with promo code
-            cart, created = Cart.objects.get_or_create(user=request.user)
-            total_amount = cart.get_total()
-            
-            order = form.save(commit=False)
-            order.user = request.user
-            order.total_amount = total_amount
-            order.save()
-            
-            for cart_item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product_name=cart_item.product_name,
-                    quantity=cart_item.quantity,
-                    price=cart_item.price,
-                    custom_design=cart_item.custom_design
-                )
-            
-            # Clear cart and promo code
-            cart_items.delete()
-            cart.promo_code = None
-            cart.save()
-            
             messages.success(request, f"Order placed successfully! Order number: {order.order_number}")
             return redirect('order_detail', order_id=order.id)
     else:
-        form = OrderForm()
+        form = OrderForm(initial={'checkout_token': uuid.uuid4().hex})
     
     # Get cart with promo code
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_items = cart.get_items()
-    subtotal = cart.get_subtotal()
-    discount = cart.get_discount()
-    total = cart.get_total()
+    cart = Cart.for_request(request)
+    summary = cart.get_summary()
     
     context = {
         'form': form,
-        'cart_items': cart_items,
-        'subtotal': subtotal,
-        'discount': discount,
-        'total': total,
+        'cart_items': cart.get_items(),
+        'subtotal': summary.subtotal,
+        'discount': summary.discount,
+        'total': summary.total,
         'promo_code': cart.promo_code,
     }
     return render(request, 'shop/checkout.html', context)
 
+def place_order(request, form, token):
+    """Turn the user's cart into an order in one transaction.
+
+    Returns the existing order when ``token`` was already used, and None when the cart is empty.
+    """
+    # Taken before the transaction so it comes from this worker's cached block
+    order_number = next_order_number()
+    with transaction.atomic():
+        # Lock the cart first so a double submit waits here and then sees the finished order
+        cart = Cart.objects.select_for_update().select_related('promo_code').get(pk=Cart.for_request(request).pk)
+        if token:
+            existing = Order.objects.filter(user=request.user, checkout_token=token).first()
+            if existing is not None:
+                return existing
+        
+        cart_items = list(cart.get_items().select_for_update())
+        if not cart_items:
+            return None
+        
+        # Priced before redeeming: claiming the last use makes the code invalid in memory
+        summary = cart.get_summary()
+        # Claims a use only while uses remain; rolled back if the order fails
+        if cart.promo_code and not cart.promo_code.redeem():
+            raise PromoCodeUnavailable(cart.promo_code.code)
+        
+        order = form.save(commit=False)
+        order.user = request.user
+        order.order_number = order_number
+        order.total_amount = summary.total
+        order.checkout_token = token
+        order.save()
+        
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=cart_item.product_id,
+                product_name=cart_item.product_name,
+                quantity=cart_item.quantity,
+                price=cart_item.price,
+                custom_design_id=cart_item.custom_design_id,
+            )
+            for cart_item in cart_items
+        ])
+        
+        # Only sent once the order has committed
+        send_order_confirmation.delay(order.pk)
+        
+        # Clear cart and promo code
+        CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+        cart.set_promo_code(None)
+        
+        # Counted with the order, so a failed checkout or a resubmitted token never counts twice.
+        # Left for last so popular product rows stay locked only until the commit
+        sales = Counter()
+        for cart_item in cart_items:
+            if cart_item.product_id:
+                sales[cart_item.product_id] += cart_item.quantity
+        bulk_increment(Product, 'sales_count', sales)
+    return order
+
 @login_required
 def order_detail(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
@@ -215,9 +398,36 @@ def order_detail(request, order_id):
 
 @login_required
 def my_orders(request):
-    orders = Order.objects.filter(user=request.user)
-    return render(request, 'shop/my_orders.html', {'orders': orders})
+    # Two queries per page however many orders or items there are: the orders with
+    # their item counts, and the first few items of each for the preview
+    orders = Order.objects.filter(user=request.user).annotate(item_count=Count('items'))
+    page_obj = KeysetPaginator(orders, ORDERS_PER_PAGE, ordering=('-created_at', '-pk')).page(request.GET.get('cursor'))
+    # Prefetched for the page only, not the extra row the paginator peeks at
+    prefetch_related_objects(page_obj.object_list, Prefetch(
+        'items', queryset=OrderItem.objects.order_by('pk')[:ORDER_PREVIEW_ITEMS], to_attr='preview_items',
+    ))
+    for order in page_obj:
+        order.more_items = max(order.item_count - ORDER_PREVIEW_ITEMS, 0)
+    context = {
+        'orders': page_obj,
+        'page_obj': page_obj,
+    }
+    return render(request, 'shop/my_orders.html', context)
 
+@staff_member_required
+def task_stats(request):
+    return JsonResponse(queue_stats())
 
 
+@never_cache
+def metrics(request):
+    """Prometheus scrape endpoint for staff, or for `Authorization: Bearer <METRICS_TOKEN>`"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    if token and authorization:
+        if not constant_time_compare(authorization, f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not (request.user.is_active and request.user.is_staff):
+        return redirect_to_login(request.get_full_path(), reverse('admin:login'))
+    return HttpResponse(render_metrics(), content_type=METRICS_CONTENT_TYPE)
 